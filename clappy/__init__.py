@@ -6,11 +6,9 @@ __author_email__ = 'yokoyamacode@gmail.com'
 __url__ = 'https://github.com/yoko72/clappy'
 
 from .main import *
-from logging import getLogger
 
-logger = getLogger(__name__)
-
-__all__ = ["parse", "get_parser", "auto_help_generator", "clear_parser",
-           "get_group", "subcommand",
-           "action", "nargs", "SUPPRESS", "ReturnOnHelp",
-           "set_args_getting_parsed", "set_name_of_main_script"]
+__all__ = ["parse", "parse_lazy", "parse_many", "get_parser", "auto_help_generator", "clear_parser",
+           "get_group", "get_exclusive_group", "subcommand", "dispatch",
+           "action", "nargs", "SUPPRESS", "ReturnOnHelp", "Stream",
+           "set_args_getting_parsed", "set_name_of_main_script",
+           "stats", "enable_stats", "Session", "get_session"]
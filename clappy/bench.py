@@ -0,0 +1,335 @@
+"""
+Benchmarks of clappy against hand-written plain argparse doing the same work.
+
+Run as ``python -m clappy.bench``. Results are printed as JSON, so that they can be compared between releases.
+Each benchmark reports the best time in seconds of repeated runs for clappy and for argparse, and their ratio.
+memory reports the least peak of bytes traced by tracemalloc instead.
+"""
+import argparse
+import contextlib
+import functools
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from . import main, __version__
+
+SIZES = {
+    "options": (10, 100, 1000, 10000),
+    "argv": (10, 1000, 100000),
+    "argv_options": (10, 1000, 100000),
+    "subcommands": (1, 50, 500),
+    "modules": (10, 100),
+    "abbreviations": (10, 100, 1000),
+    "help": (10, 100, 1000),
+    "import": (1,),
+    "memory": (100, 1000, 5000),
+}
+QUICK_SIZES = {name: sizes[:2] for name, sizes in SIZES.items()}
+# argparse finds the next option by a scan of all options, so the baseline is skipped above this size.
+MAX_SIZES_OF_ARGPARSE = {"argv_options": 10000}
+OPTIONS_PER_MODULE = 10
+GIVEN_OPTIONS_OF_MEMORY = 10
+UNITS = {"memory": "bytes"}  # others are seconds
+
+
+def _reset_clappy(args):
+    main._default_session = main.Session(args)
+
+
+def _args_of_options(count):
+    args = []
+    for i in range(count):
+        args += [f"--opt{i}", str(i)]
+    return args
+
+
+def bench_options(count):
+    """Parses count of options given in argv one by one."""
+    args = _args_of_options(count)
+
+    def run_clappy():
+        _reset_clappy(args)
+        main.get_parser(auto_grouping=False)
+        for i in range(count):
+            main.parse(f"--opt{i}")
+
+    def run_argparse():
+        parser = argparse.ArgumentParser()
+        for i in range(count):
+            parser.add_argument(f"--opt{i}")
+        parser.parse_known_args(args)
+
+    return run_clappy, run_argparse
+
+
+def bench_argv(count):
+    """Parses argv of count tokens, which are a flag and positionals."""
+    args = ["--verbose"] + [f"file{i}" for i in range(count - 1)]
+
+    def run_clappy():
+        _reset_clappy(args)
+        main.get_parser(auto_grouping=False)
+        main.parse("--verbose", is_flag=True)
+        main.parse("files", nargs="*")
+
+    def run_argparse():
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--verbose", action="store_true")
+        parser.add_argument("files", nargs="*")
+        parser.parse_known_args(args)
+
+    return run_clappy, run_argparse
+
+
+def bench_argv_options(count):
+    """Parses argv of count tokens, which are options with values interleaved with positionals."""
+    args = []
+    for i in range(count // 3):
+        args += [f"--opt{i % 10}", str(i), f"file{i}"]
+    args += [f"file{i}" for i in range(count - len(args))]
+
+    def run_clappy():
+        _reset_clappy(args)
+        main.get_parser(auto_grouping=False)
+        for i in range(10):
+            main.parse(f"--opt{i}")
+        main.parse("files", nargs="*")
+
+    def run_argparse():
+        parser = argparse.ArgumentParser()
+        for i in range(10):
+            parser.add_argument(f"--opt{i}")
+        parser.add_argument("files", nargs="*")
+        parser.parse_known_args(args)
+
+    return run_clappy, run_argparse
+
+
+def bench_subcommands(count):
+    """Registers count of subcommands, and parses an option of the last one invoked."""
+    args = [f"cmd{count - 1}", "--opt", "1"]
+
+    def run_clappy():
+        _reset_clappy(args)
+        main.get_parser(auto_grouping=False)
+        for i in range(count):
+            subcommand = main.subcommand(f"cmd{i}")
+            if subcommand.invoked:
+                subcommand.parse("--opt")
+
+    def run_argparse():
+        parser = argparse.ArgumentParser()
+        subparsers = parser.add_subparsers()
+        for i in range(count):
+            subparser = subparsers.add_parser(f"cmd{i}")
+            subparser.add_argument("--opt")
+        parser.parse_known_args(args)
+
+    return run_clappy, run_argparse
+
+
+def bench_abbreviations(count):
+    """
+    Parses count of options, where 10 of them are given by abbreviations like --opt1-v for --opt1-value.
+    A positional is registered first, so that each parse takes a pass over all args.
+    """
+    args = ["file"]
+    for i in range(0, count, max(count // 10, 1)):
+        args += [f"--opt{i}-v", str(i)]
+
+    def run_clappy():
+        _reset_clappy(args)
+        main.get_parser(auto_grouping=False)
+        main.parse("files", nargs="*")
+        for i in range(count):
+            main.parse(f"--opt{i}-value")
+
+    def run_argparse():
+        parser = argparse.ArgumentParser()
+        parser.add_argument("files", nargs="*")
+        for i in range(count):
+            parser.add_argument(f"--opt{i}-value")
+        parser.parse_known_args(args)
+
+    return run_clappy, run_argparse
+
+
+def bench_modules(count):
+    """Parses options registered from count of modules, which are grouped automatically."""
+    args = []
+    codes = []
+    for i in range(count):
+        names = [f"--mod{i}-opt{j}" for j in range(OPTIONS_PER_MODULE)]
+        for name in names:
+            args += [name, "1"]
+        source = "".join(f"main.parse({name!r})\n" for name in names)
+        codes.append((f"mod{i}", compile(source, f"mod{i}.py", "exec")))
+
+    def run_clappy():
+        _reset_clappy(args)
+        main.get_parser(auto_grouping=True)
+        for name, code in codes:
+            exec(code, {"__name__": name, "main": main})
+
+    def run_argparse():
+        parser = argparse.ArgumentParser()
+        for i in range(count):
+            group = parser.add_argument_group(f"mod{i}")
+            for j in range(OPTIONS_PER_MODULE):
+                group.add_argument(f"--mod{i}-opt{j}")
+        parser.parse_known_args(args)
+
+    return run_clappy, run_argparse
+
+
+def bench_help(count):
+    """Renders help of count of options with -h."""
+    def run_clappy():
+        _reset_clappy(["-h"])
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.suppress(SystemExit):
+            with main.get_parser(auto_grouping=False):
+                for i in range(count):
+                    main.parse(f"--opt{i}", help=f"help of option {i}")
+
+    def run_argparse():
+        parser = argparse.ArgumentParser()
+        for i in range(count):
+            parser.add_argument(f"--opt{i}", help=f"help of option {i}")
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.suppress(SystemExit):
+            parser.parse_args(["-h"])
+
+    return run_clappy, run_argparse
+
+
+def _measure_import(name):
+    """Returns cumulative seconds of importing the module in a new interpreter, reported by -X importtime."""
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {name}"],
+                            env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if line.startswith("import time:") and fields[-1].strip() == name:
+            return int(fields[1]) / 1e6
+    raise RuntimeError(f"importtime of {name} is not reported.")
+
+
+def bench_import(count):
+    """Imports clappy and argparse in a new interpreter. count is ignored."""
+    return functools.partial(_measure_import, "clappy"), functools.partial(_measure_import, "argparse")
+
+
+def _measure_memory(func):
+    """Returns the peak of bytes allocated while func runs, traced by tracemalloc."""
+    import tracemalloc
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_memory(count):
+    """Registers count of options one by one where a few of them are given, then a positional taking the rest."""
+    args = []
+    for i in range(0, count, max(1, count // GIVEN_OPTIONS_OF_MEMORY)):
+        args += [f"--opt{i}", str(i)]
+
+    def run_clappy():
+        _reset_clappy(args)
+        main.get_parser(auto_grouping=False)
+        for i in range(count):
+            main.parse(f"--opt{i}")
+        main.parse("files", nargs="*")
+
+    def run_argparse():
+        parser = argparse.ArgumentParser()
+        for i in range(count):
+            parser.add_argument(f"--opt{i}")
+        parser.add_argument("files", nargs="*")
+        parser.parse_known_args(args)
+
+    return functools.partial(_measure_memory, run_clappy), functools.partial(_measure_memory, run_argparse)
+
+
+BENCHMARKS = {
+    "options": bench_options,
+    "argv": bench_argv,
+    "argv_options": bench_argv_options,
+    "subcommands": bench_subcommands,
+    "modules": bench_modules,
+    "abbreviations": bench_abbreviations,
+    "help": bench_help,
+    "import": bench_import,
+    "memory": bench_memory,
+}
+
+
+def _best_of(func, repeat, reports_itself=False):
+    """Returns the best seconds of repeated calls. If reports_itself, func returns the measure to count."""
+    best = float("inf")
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            reported = func()
+            elapsed = reported if reports_itself else time.perf_counter() - start
+            best = min(best, elapsed)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return best
+
+
+def run(names=None, repeat=3, quick=False) -> dict:
+    """Runs benchmarks of names, or all of them if None, and returns results as dict serializable to JSON."""
+    sizes_of = QUICK_SIZES if quick else SIZES
+    results = []
+    for name in names or BENCHMARKS:
+        for size in sizes_of[name]:
+            run_clappy, run_argparse = BENCHMARKS[name](size)
+            reports_itself = name in ("import", "memory")
+            clappy_time = _best_of(run_clappy, repeat, reports_itself)
+            if size > MAX_SIZES_OF_ARGPARSE.get(name, size):
+                argparse_time = None
+            else:
+                argparse_time = _best_of(run_argparse, repeat, reports_itself)
+            results.append({"name": name, "size": size, "unit": UNITS.get(name, "seconds"), "clappy": clappy_time,
+                            "argparse": argparse_time, "ratio": clappy_time / argparse_time if argparse_time else None})
+    _reset_clappy(sys.argv[1:])
+    return {
+        "clappy": __version__,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def _main():
+    parser = argparse.ArgumentParser(prog="python -m clappy.bench", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", action="append", choices=list(BENCHMARKS),
+                        help="runs only given benchmark. can be given multiple times.")
+    parser.add_argument("--repeat", type=int, default=3, help="count of runs to take the best. default: 3")
+    parser.add_argument("--quick", action="store_true", help="skips the largest sizes.")
+    parser.add_argument("-o", "--output", help="writes JSON to this file instead of stdout.")
+    args = parser.parse_args()
+
+    report = json.dumps(run(args.only, repeat=args.repeat, quick=args.quick), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,62 @@
+"""
+Texts cached as files in the user cache directory.
+
+Each file starts with the fingerprint of what the text is made from,
+and the text is returned only while the fingerprint matches. So the cache is invalidated automatically.
+"""
+import os
+import sys
+from typing import Optional
+
+ENV_OF_CACHE_DIR = "CLAPPY_CACHE_DIR"
+
+
+def get_cache_dir() -> str:
+    """Returns the directory for clappy in the user cache directory of the platform, or $CLAPPY_CACHE_DIR if set."""
+    cache_dir = os.environ.get(ENV_OF_CACHE_DIR)
+    if cache_dir:
+        return cache_dir
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser(os.path.join("~", "AppData", "Local"))
+    elif sys.platform == "darwin":
+        base = os.path.expanduser(os.path.join("~", "Library", "Caches"))
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser(os.path.join("~", ".cache"))
+    return os.path.join(base, "clappy")
+
+
+def make_fingerprint(*parts) -> str:
+    """Returns a hash of repr of parts. Parts should be made of str, numbers, None and tuples of them."""
+    import hashlib
+    return hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _get_path(kind: str, key: tuple) -> str:
+    return os.path.join(get_cache_dir(), kind, make_fingerprint(*key) + ".txt")
+
+
+def load(kind: str, key: tuple, fingerprint: str) -> Optional[str]:
+    """Returns the text stored for the key, or None if not stored or its fingerprint differs."""
+    try:
+        with open(_get_path(kind, key), encoding="utf-8") as file:
+            if file.readline().rstrip("\n") != fingerprint:
+                return None
+            return file.read()
+    except OSError:
+        return None
+
+
+def store(kind: str, key: tuple, fingerprint: str, text: str):
+    """Stores the text for the key, replacing the old one. Failure of writing is ignored."""
+    path = _get_path(kind, key)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write(fingerprint + "\n" + text)
+        os.replace(temp_path, path)
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
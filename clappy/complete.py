@@ -0,0 +1,296 @@
+"""
+Shell completion of scripts using clappy.
+
+If $_CLAPPY_COMPLETE is set, e.g. by the hook of bash or zsh, the script is run for completion instead of its work.
+Args are the words of $COMP_LINE before $COMP_POINT, and clappy.parse() returns as if -h is given.
+At the end of the with block of clappy.get_parser(), candidates for the word under the cursor are printed
+one per line, and the script exits. Options, subcommands and choices are completed.
+Scripts without the with block print them at exit instead, and their outputs to stdout are discarded.
+
+Each run stores a compact spec of the parsers it visited in the user cache directory.
+``python -m clappy.complete`` answers from the spec without running the script,
+while the script and modules loaded from its directory are not changed.
+
+Run ``python -m clappy.complete bash script.py`` to print the hook, e.g. in ~/.bashrc:
+
+    eval "$(python -m clappy.complete bash ~/bin/tool.py)"
+"""
+import argparse
+import os
+import re
+import shlex
+import sys
+
+from . import cache, frozen, utils, __version__
+
+SHELLS = ("bash", "zsh")
+_stdout = None  # stdout for candidates, while outputs of the script are discarded until it exits
+_responded = False
+_NEGATIVE_NUMBER = re.compile(r'^-\d+$|^-\d*\.\d+$')  # same as argparse
+_GREEDY_NARGS = ("*", "+", argparse.REMAINDER)
+
+_BASH_HOOK = """\
+_clappy_complete_{function}() {{
+    local IFS=$'\\n'
+    COMPREPLY=($({env}=bash COMP_LINE="$COMP_LINE" COMP_POINT="$COMP_POINT" {command} 2>/dev/null))
+}}
+complete -o default -F _clappy_complete_{function} {name}
+"""
+_ZSH_HOOK = """\
+_clappy_complete_{function}() {{
+    local -a candidates
+    candidates=("${{(@f)$({env}=zsh COMP_LINE="$BUFFER" COMP_POINT="$CURSOR" {command} 2>/dev/null)}}")
+    if [[ -n "${{candidates[1]}}" ]]; then
+        compadd -Q -- "${{candidates[@]}}"
+    else
+        _files
+    fi
+}}
+compdef _clappy_complete_{function} {name}
+"""
+
+
+def describe_parser(parser: argparse.ArgumentParser) -> dict:
+    """Returns the spec of parser for completion, made of str, numbers, lists and dicts for JSON."""
+    def get_choices(action):
+        return None if action.choices is None else [str(choice) for choice in action.choices]
+
+    options = {option_string: [action.nargs, get_choices(action), action.help == argparse.SUPPRESS]
+               for option_string, action in parser._option_string_actions.items()}
+    positionals = []
+    subcommands = None
+    for action in parser._actions:
+        if isinstance(action, argparse._SubParsersAction):
+            subcommands = list(action._name_parser_map)
+            break  # it takes all the rest of args
+        if not action.option_strings:
+            positionals.append([action.nargs, get_choices(action)])
+    return {"prefix_chars": parser.prefix_chars, "options": options, "positionals": positionals,
+            "subcommands": subcommands}
+
+
+def _is_option(arg: str, prefix_chars: str) -> bool:
+    return len(arg) > 1 and arg[0] in prefix_chars and not _NEGATIVE_NUMBER.match(arg)
+
+
+def _scan(spec: dict, args: list) -> tuple:
+    """
+    Returns (count of positionals given, index of the subcommand or None) in args.
+    It follows a pass of argparse roughly, but never fails for args being typed.
+    """
+    options, positionals = spec["options"], spec["positionals"]
+    count_of_positionals = 0
+    index = 0
+    length = len(args)
+    while index < length:
+        arg = args[index]
+        index += 1
+        if _is_option(arg, spec["prefix_chars"]):
+            option_string, equals, _ = arg.partition("=")
+            nargs = options.get(option_string, [0])[0]
+            if not equals and nargs != 0:
+                stop = index
+                while stop < length and not _is_option(args[stop], spec["prefix_chars"]):
+                    stop += 1
+                available = stop - index
+                if nargs in _GREEDY_NARGS:
+                    index = length if nargs == argparse.REMAINDER else stop
+                else:
+                    index += min(available, 1 if nargs in (None, "?") else nargs)
+            continue
+        if count_of_positionals < len(positionals):
+            nargs = positionals[count_of_positionals][0]
+            if nargs in _GREEDY_NARGS:
+                return count_of_positionals, None  # takes all the rest
+            count_of_positionals += 1
+            if isinstance(nargs, int):
+                index += nargs - 1
+        elif spec["subcommands"] is not None:
+            return count_of_positionals, index - 1
+    return count_of_positionals, None
+
+
+def get_dispatch_token(parser: argparse.ArgumentParser, args: list):
+    """
+    Returns the token invoking a subcommand of parser in args, or None.
+    It's found by scanning args from the main parser, since passes of argparse fail for args being typed.
+    """
+    parsers = []
+    while parser is not None:
+        parsers.append(parser)
+        parser = parser._parent_parser
+    token = None
+    for parser in reversed(parsers):
+        _, index = _scan(describe_parser(parser), args)
+        if index is None:
+            return None
+        token, args = args[index], args[index + 1:]
+    return token
+
+
+def get_candidates(specs: dict, args: list, incomplete: str):
+    """
+    Returns candidates for the incomplete word after args.
+    specs is dict from the path of subcommands like 'db migrate' to the spec of its parser.
+    Returns None if the parser of the invoked subcommand isn't in specs.
+    """
+    path = []
+    spec = specs.get("")
+    if spec is None:
+        return None
+    while True:
+        count_of_positionals, index = _scan(spec, args)
+        if index is None:
+            break
+        token = args[index]
+        if token not in spec["subcommands"]:
+            return []
+        path.append(token)
+        args = args[index + 1:]
+        spec = specs.get(" ".join(path))
+        if spec is None:
+            return None
+
+    options = spec["options"]
+    if args and args[-1] in options and options[args[-1]][0] != 0:  # the word is an arg of the option
+        return [choice for choice in options[args[-1]][1] or () if choice.startswith(incomplete)]
+    if incomplete[:1] and incomplete[0] in spec["prefix_chars"]:
+        option_string, equals, value = incomplete.partition("=")
+        if equals:
+            choices = options.get(option_string, [0, None])[1] or ()
+            return [f"{option_string}={choice}" for choice in choices if choice.startswith(value)]
+        return [option_string for option_string, (_, _, is_hidden) in options.items()
+                if option_string.startswith(incomplete) and not is_hidden]
+    positionals = spec["positionals"]
+    if count_of_positionals < len(positionals):
+        candidates = positionals[count_of_positionals][1] or ()
+    else:
+        candidates = spec["subcommands"] or ()
+    return [candidate for candidate in candidates if candidate.startswith(incomplete)]
+
+
+def _format(candidates: list, request: utils.CompletionRequest) -> str:
+    if request.shell == "bash" and "=" in request.incomplete:
+        # bash splits words at '=', so candidates replace only the part after it
+        candidates = [candidate.rpartition("=")[2] for candidate in candidates]
+    return "".join(candidate + "\n" for candidate in candidates)
+
+
+def _get_key(script: str) -> tuple:
+    return os.path.abspath(script), sys.version_info[:2]
+
+
+def _get_stamp(path: str):
+    stamp = frozen.get_stamp(path)
+    return None if stamp is None else list(stamp)  # same as loaded from JSON
+
+
+def load_specs(script: str):
+    """Returns specs of parsers stored for the script, or None if not stored or the sources are changed."""
+    import json
+    text = cache.load("complete", _get_key(script), cache.make_fingerprint(__version__))
+    if text is None:
+        return None
+    try:
+        stored = json.loads(text)
+    except ValueError:
+        return None
+    if any(_get_stamp(path) != stamp for path, stamp in stored["sources"].items()):
+        return None
+    return stored["specs"]
+
+
+def store_specs(script: str, specs: dict):
+    """Stores specs of parsers visited in this run, together with ones stored for other subcommands."""
+    import json
+    stored = load_specs(script) or {}
+    stored.update(specs)
+    sources = {path: _get_stamp(path) for path in frozen.get_sources(os.path.abspath(script))}
+    text = json.dumps({"sources": sources, "specs": stored}, separators=(",", ":"))
+    cache.store("complete", _get_key(script), cache.make_fingerprint(__version__), text)
+
+
+def respond(parser, request: utils.CompletionRequest, exits=True):
+    """Prints candidates of the request, stores the specs of parsers used for them and exits unless exits is False."""
+    global _responded
+    _responded = True
+    specs = {"": describe_parser(parser)}
+    path = []
+    while parser._subparsers_action is not None:  # follows invoked subcommands like help does
+        invoked_subcommand = parser._get_invoked_subcommand()
+        if invoked_subcommand is None:
+            break
+        path.append(get_dispatch_token(parser, request.args))
+        parser = invoked_subcommand.get_parser()
+        specs[" ".join(path)] = describe_parser(parser)
+    candidates = get_candidates(specs, request.args, request.incomplete)
+    stdout = _stdout or sys.stdout
+    stdout.write(_format(candidates or [], request))
+    stdout.flush()
+    main_file = getattr(sys.modules.get("__main__"), "__file__", None)
+    if main_file is not None:
+        store_specs(main_file, specs)
+    if exits:
+        sys.exit(0)
+
+
+def respond_at_exit(session):
+    """
+    Responds at exit of the script by the parser of session, unless it responds at the end of the with block before.
+    Scripts only calling clappy.parse() run to the end with values same as on help, so their outputs to stdout
+    are discarded until then, not to be taken as candidates.
+    """
+    global _stdout
+    if _stdout is not None:
+        return
+    import atexit
+    _stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    atexit.register(_respond_at_exit, session)
+
+
+def _respond_at_exit(session):
+    if not _responded and session.parser is not None:
+        respond(session.parser, session.completion, exits=False)
+
+
+def make_hook(shell: str, script: str, name: str = None) -> str:
+    """Returns the script of shell registering completion of the command name, which runs script."""
+    script = os.path.abspath(script)
+    name = name or os.path.basename(script)
+    command = " ".join(shlex.quote(word) for word in (sys.executable, "-m", "clappy.complete", shell, script))
+    hook = {"bash": _BASH_HOOK, "zsh": _ZSH_HOOK}[shell]
+    return hook.format(function=re.sub(r"\W", "_", name), env=utils.ENV_OF_COMPLETION, command=command,
+                       name=shlex.quote(name))
+
+
+def answer(script: str):
+    """Prints candidates for the request in environment variables from the cache, or by running script."""
+    request = utils.CompletionRequest.from_environ()
+    specs = load_specs(script)
+    candidates = None if specs is None else get_candidates(specs, request.args, request.incomplete)
+    if candidates is not None:
+        sys.stdout.write(_format(candidates, request))
+        return
+    import runpy
+    script = os.path.abspath(script)
+    sys.argv = [script, *request.args]
+    sys.path[0] = os.path.dirname(script)
+    runpy.run_path(script, run_name="__main__")  # clappy of the script responds and exits
+
+
+def _main():
+    parser = argparse.ArgumentParser(prog="python -m clappy.complete",
+                                     description="Prints the hook of shell completion for a script using clappy.")
+    parser.add_argument("shell", choices=SHELLS)
+    parser.add_argument("script", help="path of the script.")
+    parser.add_argument("--name", help="name of the command running the script. default: file name of the script")
+    args = parser.parse_args()
+    if os.environ.get(utils.ENV_OF_COMPLETION):  # called by the hook
+        answer(args.script)
+    else:
+        sys.stdout.write(make_hook(args.shell, args.script, args.name))
+
+
+if __name__ == "__main__":
+    _main()
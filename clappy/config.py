@@ -0,0 +1,79 @@
+"""
+Defaults of arguments given by environment variables and config files.
+
+They are loaded once into a dict from dest to value, so that each registration finds its default by a lookup.
+Environment variables override config files, and later config files override earlier ones.
+"""
+import os
+from typing import Dict, Iterable, Optional
+
+BOOLEAN_STRINGS = {"1": True, "true": True, "yes": True, "on": True,
+                   "0": False, "false": False, "no": False, "off": False, "": False}
+
+
+def normalize(key: str) -> str:
+    """Returns the key of dest for a name in environment variables or config files, e.g. 'LOG-LEVEL' to 'log_level'."""
+    return key.replace("-", "_").lower()
+
+
+def load(env_prefix: Optional[str] = None, config_files: Iterable[str] = ()) -> Dict[str, object]:
+    """
+    Returns dict from normalized dest to the value given by environment variables or config files.
+
+    Variables named env_prefix + dest in upper case like APP_LOG_LEVEL give values as str.
+    Config files are INI, or TOML if the suffix is .toml. Keys in all sections or tables are read,
+    and values of TOML keep their types. Files which don't exist are skipped, and ~ in paths is expanded.
+    """
+    defaults = {}
+    for path in config_files:
+        path = os.path.expanduser(path)
+        if os.path.isfile(path):
+            defaults.update(_load_toml(path) if path.endswith(".toml") else _load_ini(path))
+    if env_prefix:
+        for name, value in os.environ.items():
+            if name.startswith(env_prefix) and len(name) > len(env_prefix):
+                defaults[normalize(name[len(env_prefix):])] = value
+    return defaults
+
+
+def _load_ini(path: str) -> Dict[str, object]:
+    import configparser
+    parser = configparser.ConfigParser(interpolation=None)
+    with open(path, encoding="utf-8") as file:
+        parser.read_file(file)
+    values = {normalize(key): value for key, value in parser.defaults().items()}
+    for section in parser.sections():
+        values.update((normalize(key), value) for key, value in parser.items(section, raw=True))
+    return values
+
+
+def _load_toml(path: str) -> Dict[str, object]:
+    try:
+        import tomllib
+    except ImportError:  # before python 3.11
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise ImportError(f"tomli is required to read {path} before Python 3.11. "
+                              f"Install it by pip install clappy[toml].", name="tomli") from None
+    with open(path, "rb") as file:
+        document = tomllib.load(file)
+    values = {}
+    for key, value in document.items():
+        if isinstance(value, dict):
+            values.update((normalize(inner_key), inner_value) for inner_key, inner_value in value.items()
+                          if not isinstance(inner_value, dict))
+        else:
+            values[normalize(key)] = value
+    return values
+
+
+def to_bool(value, dest: str) -> bool:
+    """Returns bool of a value for a flag, which may be str like 'yes' or '0'."""
+    if isinstance(value, str):
+        try:
+            return BOOLEAN_STRINGS[value.strip().lower()]
+        except KeyError:
+            raise ValueError(f"{value!r} given for {dest} by environment variables or config files "
+                             f"is not a boolean. Use one of {', '.join(repr(key) for key in BOOLEAN_STRINGS)}.")
+    return bool(value)
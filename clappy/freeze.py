@@ -0,0 +1,170 @@
+"""
+Generates the frozen parser of a script, which parses args by precomputed tables without argparse.
+
+Run as ``python -m clappy.freeze script.py [args ...]``. The script runs with args once, e.g. with -h,
+and all arguments registered by clappy.parse() in the run are written as tables to script_clappy_frozen.py.
+From then on, clappy.parse() in the script returns values of args parsed by the tables,
+while the calls are same as the recorded ones and sources of the script and its modules are not changed.
+Otherwise clappy parses dynamically as usual, so the frozen parser never changes results.
+"""
+import argparse
+import os
+import runpy
+import sys
+
+from . import main, frozen, utils, __version__
+
+_KINDS = (  # checked in order, since store_true is subclass of store_const
+    (argparse._HelpAction, "help"),
+    (argparse._StoreConstAction, "store_const"),
+    (argparse._StoreAction, "store"),
+    (argparse._AppendAction, "append"),
+    (argparse._CountAction, "count"),
+)
+_TYPE_NAMES = {None: None, str: "str", int: "int", float: "float"}
+
+
+class NotFreezable(Exception):
+    """Raised if the parser uses things which the frozen parser doesn't support."""
+
+
+def _is_literal(value) -> bool:
+    if isinstance(value, (str, int, float, bool, type(None))):
+        return True
+    return isinstance(value, (list, tuple)) and all(_is_literal(val) for val in value)
+
+
+def _get_kind(action) -> str:
+    for action_class, kind in _KINDS:
+        if type(action) is action_class or (kind == "store_const" and isinstance(action, action_class)):
+            return kind
+    raise NotFreezable(f"{type(action).__name__} of {action.dest} is not supported.")
+
+
+def _describe_action(action) -> tuple:
+    kind = _get_kind(action)
+    if action.type not in _TYPE_NAMES:
+        raise NotFreezable(f"type of {action.dest} is not one of str, int and float.")
+    if action.option_strings:
+        if not (action.nargs in (None, "?", "*", "+") or isinstance(action.nargs, int)):
+            raise NotFreezable(f"nargs={action.nargs!r} of {action.dest} is not supported.")
+    elif action.nargs is not None:
+        raise NotFreezable(f"positional {action.dest} takes other than an arg.")
+    if kind != "help" and action.default is argparse.SUPPRESS:
+        raise NotFreezable(f"default of {action.dest} is SUPPRESS.")
+    choices = tuple(action.choices) if action.choices is not None else None
+    for value in (action.const, action.default, choices):
+        if not _is_literal(value):
+            raise NotFreezable(f"{value!r} of {action.dest} can't be written as literal.")
+    return (action.dest, kind, tuple(action.option_strings), action.nargs, _TYPE_NAMES[action.type], action.const,
+            action.default, choices, action.required)
+
+
+def _check_parser(parser: main._Parser):
+    reasons = {
+        "subcommands": parser._subparsers_action is not None,
+        "mutually exclusive groups": bool(parser._mutually_exclusive_groups),
+        "fromfile_prefix_chars": parser.fromfile_prefix_chars is not None,
+        "prefix_chars other than '-'": parser.prefix_chars != "-",
+        "options like negative numbers": bool(parser._has_negative_number_optionals),
+        "set_defaults": bool(parser._defaults),
+        "env_prefix and config_files": parser._has_layered_defaults,
+    }
+    for reason, is_used in reasons.items():
+        if is_used:
+            raise NotFreezable(f"{reason} is not supported.")
+    dests = [action.dest for action in parser._actions if action.dest is not argparse.SUPPRESS]
+    if len(dests) != len(set(dests)):
+        raise NotFreezable("arguments sharing a dest are not supported.")
+
+
+def make_spec(parser: main._Parser, arguments_of_parser, sources) -> frozen.Spec:
+    """Returns Spec of arguments registered to parser, or raises NotFreezable."""
+    _check_parser(parser)
+    index_of_action = {action: i for i, action in enumerate(parser._actions)}
+    actions = tuple(_describe_action(action) for action in parser._actions)
+    options = {option_string: index_of_action[action]
+               for option_string, action in parser._option_string_actions.items()}
+    positionals = tuple(index_of_action[action] for action in parser._actions if not action.option_strings)
+    title_of_action = {}
+    for group in parser._action_groups:
+        if group is not parser._positionals and group is not parser._optionals:  # groups made by clappy
+            for action in group._group_actions:
+                title_of_action[action] = group.title
+    calls = {frozen.describe(key): (index_of_action[action], title_of_action.get(action))
+             for key, action in parser._registered_actions.items()}
+    return frozen.Spec(__version__, tuple(sys.version_info[:2]), frozen.describe(arguments_of_parser), sources,
+                       calls, options, actions, positionals)
+
+
+def format_spec(spec: frozen.Spec, script: str) -> str:
+    """Returns source of the module of the frozen parser."""
+    lines = [
+        f'"""Frozen parser of {os.path.basename(script)} generated by python -m clappy.freeze. Don\'t edit."""',
+        "from clappy import frozen",
+        "",
+        "SPEC = frozen.Spec(",
+    ]
+    for name in frozen.Spec.__slots__:
+        value = getattr(spec, name)
+        if isinstance(value, dict) and value:
+            lines.append(f"    {name}={{")
+            lines.extend(f"        {key!r}: {val!r}," for key, val in value.items())
+            lines.append("    },")
+        elif isinstance(value, tuple) and value and name == "actions":
+            lines.append(f"    {name}=(")
+            lines.extend(f"        {val!r}," for val in value)
+            lines.append("    ),")
+        else:
+            lines.append(f"    {name}={value!r},")
+    lines += [
+        ")",
+        "",
+        "",
+        "def parse(args):",
+        '    """Returns dict from dest to value of args, or raises frozen.Fallback if args need argparse."""',
+        "    return SPEC.parse(args)",
+        "",
+    ]
+    return "\n".join(lines)
+
+
+def freeze(script: str, args: list) -> str:
+    """
+    Runs script with args, and writes the frozen parser of its arguments next to the script.
+    Returns the path written, which is the only path the script loads it from.
+    """
+    script = os.path.abspath(script)
+    output = utils.get_path_of_frozen(script)
+    if os.path.exists(output):
+        os.remove(output)  # the script must run dynamically to register all arguments
+    sys.argv = [script, *args]
+    sys.path[0] = os.path.dirname(script)
+    main.set_args_getting_parsed(args)
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit:
+        pass
+    session = main.get_session()
+    if session.parser is None:
+        raise NotFreezable("no argument is registered.")
+    spec = make_spec(session.parser, session.arguments_of_parser, frozen.get_sources(script, excluded=output))
+    with open(output, "w", encoding="utf-8") as file:
+        file.write(format_spec(spec, script))
+    return output
+
+
+def _main():
+    parser = argparse.ArgumentParser(prog="python -m clappy.freeze", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("script", help="path of the script to run.")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="args given to the script, e.g. -h.")
+    args = parser.parse_args()
+    try:
+        output = freeze(args.script, args.args)
+    except NotFreezable as e:
+        parser.exit(1, f"{parser.prog}: can't freeze {args.script}, since {e}\n")
+    print(f"{parser.prog}: wrote {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    _main()
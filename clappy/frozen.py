@@ -0,0 +1,305 @@
+"""
+Runtime of frozen parsers generated by ``python -m clappy.freeze``.
+
+A frozen parser is a module of tables made from the arguments registered in a run of the script.
+Args are parsed by lookups of the tables without argparse, and clappy.parse() returns values of them while its calls
+are same as the recorded ones. Anything the tables can't tell same as argparse, e.g. -h, unknown options or errors,
+raises Fallback, and clappy parses dynamically from then on.
+"""
+import os
+import re
+import sys
+
+from . import __version__
+
+_NEGATIVE_NUMBER = re.compile(r'^-\d+$|^-\d*\.\d+$')  # same as argparse
+_CONVERTERS = {None: None, "str": str, "int": int, "float": float}
+
+
+class Fallback(Exception):
+    """Raised if args or calls of parse need the dynamic parser."""
+
+
+def get_stamp(path: str):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def get_sources(script: str, excluded: str = None) -> dict:
+    """Returns stamps of the script and modules loaded from its directory, which may register arguments."""
+    directory = os.path.dirname(script)
+    paths = {script}
+    for module in list(sys.modules.values()):
+        path = getattr(module, "__file__", None)
+        if path and os.path.abspath(path).startswith(directory + os.sep):
+            paths.add(os.path.abspath(path))
+    if excluded is not None:
+        paths.discard(os.path.abspath(excluded))
+    return {path: get_stamp(path) for path in sorted(paths)}
+
+
+def describe(value) -> str:
+    """Returns str of frozen value which is same across processes, unlike hash or repr of functions and sets."""
+    def canonical(val):
+        if isinstance(val, (str, int, float, bool, type(None))):
+            return val
+        elif isinstance(val, tuple):
+            return tuple(canonical(v) for v in val)
+        elif isinstance(val, (set, frozenset)):
+            return tuple(sorted((canonical(v) for v in val), key=repr))
+        qualname = getattr(val, "__qualname__", None)
+        if qualname is not None:
+            return f"{getattr(val, '__module__', None)}.{qualname}"
+        return repr(val)  # may include id, so that it never matches
+    return repr(canonical(value))
+
+
+class Spec:
+    """
+    Tables of a frozen parser.
+
+    calls: Dict[described registration key of parse, (index of action, title of group or None)]
+    options: Dict[option string, index of action]
+    actions: Tuple of (dest, kind, option strings, nargs, name of type, const, default, choices, required)
+        kind is one of store, store_const, append, count and help.
+    positionals: Tuple of indices of positional actions, which take an arg each.
+    """
+    __slots__ = ("clappy_version", "python_version", "parser_arguments", "sources", "calls", "options", "actions",
+                 "positionals")
+
+    def __init__(self, clappy_version, python_version, parser_arguments, sources, calls, options, actions,
+                 positionals):
+        self.clappy_version = clappy_version
+        self.python_version = python_version
+        self.parser_arguments = parser_arguments
+        self.sources = sources
+        self.calls = calls
+        self.options = options
+        self.actions = actions
+        self.positionals = positionals
+
+    def is_current(self, parser_arguments) -> bool:
+        """Returns if the spec was recorded by the same clappy, python, get_parser and sources of modules."""
+        return (self.clappy_version == __version__ and self.python_version == tuple(sys.version_info[:2])
+                and self.parser_arguments == describe(parser_arguments)
+                and all(get_stamp(path) == stamp for path, stamp in self.sources.items()))
+
+    def parse(self, args: list) -> dict:
+        """Returns dict from dest to value same as namespace of argparse, or raises Fallback."""
+        values, extras = self.parse_known(args, len(self.actions))
+        if extras:
+            raise Fallback("unrecognized args")
+        return values
+
+    def parse_known(self, args: list, count_of_actions: int) -> tuple:
+        """
+        Returns dict from dest to value and list of extras, parsed by the first count_of_actions actions.
+
+        It's same as the pass of clappy after the count of actions got registered,
+        where options registered later are unrecognized and their args may be taken by positionals.
+        """
+        actions = self.actions
+        tokens = [self._classify(arg, count_of_actions) for arg in args]
+        values = {action[0]: action[6] for action in actions[:count_of_actions] if action[1] != "help"}
+        extras = []
+        seen = set()
+        locked = set()  # actions taking only the first occurrence like ModifiedParser._run_if_not_parsed
+        positionals = [i for i in self.positionals if i < count_of_actions]
+        count_of_positionals = 0
+        index = 0
+        length = len(args)
+        while index < length:
+            token = tokens[index]
+            if token is None:  # an arg for positional
+                if count_of_positionals == len(positionals):
+                    extras.append(args[index])
+                else:
+                    self._take(positionals[count_of_positionals], [args[index]], values, seen)
+                    count_of_positionals += 1
+                index += 1
+                continue
+            action_index, option_string, explicit_arg = token
+            if action_index is None:  # an option registered later
+                extras.append(args[index])
+                index += 1
+                continue
+            kind, nargs = actions[action_index][1], actions[action_index][3]
+            if explicit_arg is not None:
+                if nargs not in (None, "?", "*", "+", 1):
+                    raise Fallback("explicit arg")
+                arg_strings = [explicit_arg]
+                stop = index + 1
+            else:
+                start = stop = index + 1
+                while stop < length and tokens[stop] is None:
+                    stop += 1
+                available = stop - start
+                if nargs is None or nargs == "+":
+                    if not available:
+                        raise Fallback("expected arg")
+                    if nargs is None:
+                        stop = start + 1
+                elif nargs == "?":
+                    stop = start + min(available, 1)
+                elif isinstance(nargs, int):
+                    if available < nargs:
+                        raise Fallback("expected args")
+                    stop = start + nargs
+                arg_strings = args[start:stop]
+            if action_index not in locked:
+                self._take(action_index, arg_strings, values, seen)
+                if kind != "append" and (explicit_arg is None or f"{option_string}+{explicit_arg}" in args):
+                    option_name = option_string.lstrip("-")
+                    if values.get(option_name) is not None:
+                        locked.add(action_index)
+            index = stop
+
+        if count_of_positionals < len(positionals):
+            raise Fallback("required positionals")
+        for action_index, (dest, kind, _, _, type_name, _, default, _, required) in enumerate(actions):
+            if action_index == count_of_actions:
+                break
+            if action_index in seen or kind == "help":
+                continue
+            if required:
+                raise Fallback("required options")
+            if isinstance(default, str) and values[dest] is default:
+                values[dest] = self._convert(type_name, default)
+        return values, extras
+
+    def _classify(self, arg: str, count_of_actions: int):
+        """
+        Returns (index of action, option string, explicit arg) for an option, or None for an arg.
+        Index is None for an option registered after the count of actions.
+        """
+        if not arg or arg[0] != "-" or arg == "-":
+            return None
+        option_string, explicit_arg = arg, None
+        action_index = self.options.get(arg)
+        if action_index is None and "=" in arg:
+            option_string, explicit_arg = arg.split("=", 1)
+            action_index = self.options.get(option_string)
+        if action_index is None:
+            if _NEGATIVE_NUMBER.match(arg):
+                return None
+            raise Fallback("unknown option")  # abbreviations, jointed short options, '--' and unrecognized options
+        if action_index < count_of_actions:
+            return action_index, option_string, explicit_arg
+        for registered, index in self.options.items():
+            if index < count_of_actions and (registered.startswith(option_string) or registered == arg[:2]):
+                raise Fallback("abbreviation")  # argparse may take it as an abbreviation of a registered option
+        return None, arg, None
+
+    def _take(self, action_index, arg_strings, values, seen):
+        dest, kind, option_strings, nargs, type_name, const, default, choices, _ = self.actions[action_index]
+        seen.add(action_index)
+        if kind == "help":
+            raise Fallback("help")
+        elif kind == "store_const":
+            values[dest] = const
+        elif kind == "count":
+            count = values.get(dest)
+            values[dest] = 1 if count is None else count + 1
+        else:
+            if nargs == "?" and not arg_strings:
+                value = const if option_strings else default
+                if isinstance(value, str):
+                    value = self._convert(type_name, value)
+                self._check(value, choices)
+            elif len(arg_strings) == 1 and nargs in (None, "?"):
+                value = self._convert(type_name, arg_strings[0])
+                self._check(value, choices)
+            else:
+                value = [self._convert(type_name, arg_string) for arg_string in arg_strings]
+                for val in value:
+                    self._check(val, choices)
+            if kind == "append":
+                items = values.get(dest)
+                values[dest] = [value] if items is None else [*items, value]
+            else:
+                values[dest] = value
+
+    @staticmethod
+    def _convert(type_name, arg_string):
+        converter = _CONVERTERS[type_name]
+        if converter is None:
+            return arg_string
+        try:
+            return converter(arg_string)
+        except (TypeError, ValueError):
+            raise Fallback("invalid type") from None
+
+    @staticmethod
+    def _check(value, choices):
+        if choices is not None and value not in choices:
+            raise Fallback("invalid choice")
+
+
+class FrozenValues:
+    """Values of args getting parsed by a Spec, and the calls of parse served by them."""
+
+    def __init__(self, spec: Spec, count_of_actions: int):
+        self.spec = spec
+        self.count_of_actions = count_of_actions  # registered to the parser or served, like len(parser._actions)
+        self.served = []  # List[(args, is_flag, kwargs, title of group)] to register them on fallback
+        self._args = None
+        self._length = None
+        self._results = {}  # Dict[count of actions, (values, extras)]
+
+    def get_known(self, args: list, count_of_actions: int = None) -> tuple:
+        """Returns values and extras of args parsed by the actions registered so far, or raises Fallback."""
+        if self._args is not args or self._length != len(args):
+            self._results.clear()
+            self._args = args
+            self._length = len(args)
+        if count_of_actions is None:
+            count_of_actions = self.count_of_actions
+        result = self._results.get(count_of_actions)
+        if result is None:
+            result = self._results[count_of_actions] = self.spec.parse_known(args, count_of_actions)
+        return result
+
+    def serve(self, key, call, args: list):
+        """Returns the value for a call of parse with registration key, or raises Fallback."""
+        recorded = self.spec.calls.get(describe(key))
+        if recorded is None:
+            raise Fallback("unknown call")
+        action_index, group = recorded
+        if action_index > self.count_of_actions:
+            raise Fallback("calls in another order")  # the partial spec so far differs from the recorded one
+        is_new = action_index == self.count_of_actions
+        values, _ = self.get_known(args, self.count_of_actions + is_new)
+        if is_new and self.served:
+            last_values, _ = self.get_known(args, self.count_of_actions)
+            if any(values[dest] != value for dest, value in last_values.items()):
+                raise Fallback("value changes")  # so that the dynamic parser logs them
+        if is_new:
+            self.count_of_actions += 1
+            self.served.append((*call, group))
+        return values[self.spec.actions[action_index][0]]
+
+
+def load(path: str, parser_arguments, count_of_actions: int) -> "FrozenValues | None":
+    """
+    Returns FrozenValues of the frozen parser at path, or None if it isn't current.
+    count_of_actions is the number of actions of the parser, e.g. 1 for -h.
+    """
+    path = os.path.abspath(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    module = sys.modules.get(name)
+    if module is None or getattr(module, "__file__", None) != path:
+        directory = os.path.dirname(path)
+        if any(os.path.abspath(entry or os.curdir) == directory for entry in sys.path):
+            module = __import__(name)  # uses the bytecode cache
+        else:
+            module = type(sys)(name)
+            module.__file__ = path
+            with open(path, encoding="utf-8") as file:
+                exec(compile(file.read(), path, "exec"), module.__dict__)
+    spec = getattr(module, "SPEC", None)
+    if not isinstance(spec, Spec) or not spec.is_current(parser_arguments):
+        return None
+    return FrozenValues(spec, count_of_actions)
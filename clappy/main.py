@@ -1,31 +1,30 @@
-from sys import argv
-import logging
 import argparse
 import functools
-from typing import Optional, Union, List, Dict
+import os
+import sys
 import types
-from collections import namedtuple
-from textwrap import dedent
 
-from .modified_argparse import ModifiedParser
+from .modified_argparse import ModifiedParser, ArgumentGroup, ExclusiveGroup, SubParsersAction
 from . import utils
 
-logger = logging.getLogger(__name__)
+TYPE_CHECKING = False  # avoids importing typing at runtime
+if TYPE_CHECKING:
+    from typing import Optional, Union, List, Dict
+
+logger = utils.LazyLogger(__name__)
 SUPPRESS = argparse.SUPPRESS
+_NO_KWARGS = frozenset()  # shared by registration keys of parse without kwargs
 
 
 class _HelpContextManager:
-    singleton_instance = None
     _help_chars = ("-h", "--help")
-    MESSAGE_ON_DUPLICATE = dedent("""\
-        Another instance is already in use as context manager. 
-        Use only once to print help.""")
+    MESSAGE_ON_DUPLICATE = ("Another instance is already in use as context manager. \n"
+                            "Use only once to print help.")
     HELP_ALERT = f"To print help run all parse functions within the block of with clappy.get_parser."
-    _default_args_getting_parsed = argv[1::]
 
     def __init__(self, alerts_to_use_with_block=True):
         object.__init__(self)
-        self._args_getting_parsed: list = self._default_args_getting_parsed
+        self._args_getting_parsed: list = _get_session().args_getting_parsed
         self.count_of_active_with_block = 0  # indicates amount of currently being used in with statement
         self.alerts_to_use_with_block = alerts_to_use_with_block
         self.exits_after_help_message = True
@@ -46,9 +45,12 @@ class _HelpContextManager:
         pass
 
     def runs_for_help(self):
+        session = _get_session()
+        if session.completion is not None:
+            return True  # parse returns same as on help, until candidates are printed at the end of with block or run
         for help_char in self._help_chars:
             # noinspection PyProtectedMember
-            if help_char in self.singleton_instance._args_getting_parsed:
+            if help_char in session.parser._args_getting_parsed:
                 return True
         return False
 
@@ -66,9 +68,13 @@ def _auto_construct_parser(func):
     """Constructs parser instance as singleton if not constructed."""
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        active_parser = _Parser.singleton_instance
-        if active_parser is None:
-            _Parser.singleton_instance = _Parser()
+        session = _get_session()
+        if session.parser is None:
+            session.parser = _Parser()
+            session.parser._load_frozen(None)
+            if session.completion is not None:
+                from . import complete
+                complete.respond_at_exit(session)
         return func(*args, **kwargs)
     return wrapper
 
@@ -79,51 +85,252 @@ class ReturnOnHelp:
         return False
 
 
+class Session:
+    """
+    State of clappy, i.e. the parser, args getting parsed, groups and the subcommand in with block.
+
+    All functions of clappy work on the session of the current context.
+    It's the default session shared by the process, unless another session is entered by with statement.
+    The entered session is scoped by contextvars, so that each thread or task of asyncio can parse its own args
+    in parallel without interference.
+
+    Examples
+    --------
+    >>> def handle(request_args):
+    >>>     with clappy.Session(request_args):
+    >>>         return clappy.parse("--foo")
+    >>>
+    >>> with ThreadPoolExecutor() as executor:
+    >>>     results = list(executor.map(handle, [["--foo", "1"], ["--foo", "2"]]))
+    """
+
+    def __init__(self, args: "Union[List[str], str, None]" = None):
+        if isinstance(args, str):
+            args = utils.split_args(args)
+        self.parser: "Optional[_Parser]" = None
+        self.arguments_of_parser = None  # frozen arguments of get_parser which constructed the parser
+        self.args_getting_parsed: list = sys.argv[1::] if args is None else args
+        self.returns_on_help = ReturnOnHelp()
+        self.active_groups: "List[Union[_Group, _ExclusiveGroup]]" = []
+        self.title_group_dict: "Dict" = {}  # Dict[str:"_Group"]
+        self.name_exclusive_group_dict: "Dict" = {}  # Dict[str:"_ExclusiveGroup"]
+        self.active_subcommand: "Optional[_SubCommand]" = None
+        self.completion = None  # utils.CompletionRequest if the script is run by the hook of shell completion
+
+    def reset(self):
+        """
+        Drops the parser and everything made for it, i.e. groups, subcommands and caches,
+        so that they can be freed and the next parser starts from scratch. Args getting parsed are kept.
+        """
+        self.parser = None
+        self.arguments_of_parser = None
+        self.active_groups = []
+        self.title_group_dict = {}
+        self.name_exclusive_group_dict = {}
+        self.active_subcommand = None
+        ModifiedParser._forget_registration()
+        ModifiedParser._expanded_files.clear()
+        utils.clear_caches()
+
+    def __enter__(self):
+        session_var = _get_session_var()
+        session_var.set((self, session_var.get()))  # the outer entry is kept in the context, not in the session
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        entry = _session_var.get()
+        if entry is None or entry[0] is not self:
+            raise RuntimeError("Session is exited in a different context or order from the one it was entered.")
+        _session_var.set(entry[1])
+
+    def run(self, func, *args, **kwargs):
+        """Calls func within this session. e.g. executor.submit(session.run, func)"""
+        with self:
+            return func(*args, **kwargs)
+
+
+_default_session = Session()
+if os.environ.get(utils.ENV_OF_COMPLETION):  # run by the hook of shell completion
+    _default_session.completion = utils.CompletionRequest.from_environ()
+    _default_session.args_getting_parsed = _default_session.completion.args
+# ContextVar of (the current Session, the outer entry) or None, created on the first with block to avoid importing
+# contextvars. Entries are kept in each context, so that threads and tasks can enter the same session at once.
+_session_var = None
+_session_vars = {}  # keeps the first ContextVar created, even if threads race to create it
+
+
+def _get_session_var():
+    global _session_var
+    if _session_var is None:
+        from contextvars import ContextVar
+        _session_var = _session_vars.setdefault("session", ContextVar("clappy_session", default=None))
+    return _session_var
+
+
+def _get_session() -> Session:
+    """Returns the session entered in the current context, or the default session."""
+    if _session_var is None:
+        return _default_session
+    entry = _session_var.get()
+    return _default_session if entry is None else entry[0]
+
+
+def get_session() -> Session:
+    """Returns the session of the current context, which is the default session unless another one is entered."""
+    return _get_session()
+
+
+class Stream:
+    """
+    Value of an argument parsed with nargs=clappy.nargs.STREAM.
+    Iterating yields lines without newline from stdin if the arg is '-', or from the file if the arg is '@path'.
+    Lines are read one by one on iteration, so the memory doesn't depend on the size of input.
+    A file is opened again on each iteration, but stdin can be iterated only once.
+    """
+    STDIN = "-"
+    FILE_PREFIX = "@"
+
+    def __init__(self, arg: str):
+        if arg == self.STDIN:
+            self.path = None
+        elif arg.startswith(self.FILE_PREFIX) and len(arg) > len(self.FILE_PREFIX):
+            self.path = arg[len(self.FILE_PREFIX):]
+        else:
+            raise argparse.ArgumentTypeError(f"expected '{self.STDIN}' or '{self.FILE_PREFIX}path' but got {arg!r}")
+
+    def __iter__(self):
+        if self.path is None:
+            for line in sys.stdin:
+                yield line.rstrip("\n")
+        else:
+            with open(self.path) as file:
+                for line in file:
+                    yield line.rstrip("\n")
+
+    def __eq__(self, other):
+        return isinstance(other, Stream) and self.path == other.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __repr__(self):
+        arg = self.STDIN if self.path is None else self.FILE_PREFIX + self.path
+        return f"{self.__class__.__name__}({arg!r})"
+
+
+class Deferred:
+    """
+    Returned by parse_lazy instead of the value of command line argument.
+    All pending instances are parsed together in a pass on the first read of value,
+    or at the end of with block of the parser.
+    """
+    __slots__ = ("_parser", "_dest", "_value")
+    _PENDING = object()
+
+    def __init__(self, parser: "_Parser", dest: str):
+        self._parser = parser
+        self._dest = dest
+        self._value = self._PENDING
+
+    @property
+    def resolved(self) -> bool:
+        return self._value is not self._PENDING
+
+    @property
+    def value(self):
+        if not self.resolved:
+            self._parser.resolve_deferred()
+        return self._value
+
+    def __repr__(self):
+        value = repr(self._value) if self.resolved else "<pending>"
+        return f"{self.__class__.__name__}({self._dest}={value})"
+
+
 # noinspection PyUnresolvedReferences,PyProtectedMember
 class _Parser(_HelpContextManager, ModifiedParser):
-    singleton_instance: Optional["_Parser"] = None
-    VERBOSE_VALUE_CHANGE_MESSAGE = dedent("""\
-        While parsing {parsing_dest}, the value of "{name_of_changed_arg}" changed from {last_val} to {current_val}.
-        This usually happens because of similar names of arguments or confusing order of arguments.
-        Consider to change them if you actually got invalid result.""")
+    VERBOSE_VALUE_CHANGE_MESSAGE = (
+        'While parsing {parsing_dest}, the value of "{name_of_changed_arg}" changed from {last_val} to {current_val}.\n'
+        'This usually happens because of similar names of arguments or confusing order of arguments.\n'
+        'Consider to change them if you actually got invalid result.')
     VALUE_CHANGE_MESSAGE = '''"{changed_arg}" changed from {last_val} to {current_val} during parsing {parsing_dest}.'''
     UNRECOGNIZED_ERROR_MESSAGE = "unrecognized args: %s"
-    default_returns_on_help = ReturnOnHelp()
+    AMBIGUOUS_PREFIX_MESSAGE = ('"{shorter}" of {shorter_group} is a prefix of "{longer}" of {longer_group}. '
+                                'Abbreviations of "{shorter}" are ambiguous, and "{shorter}" given before '
+                                '{shorter_group} registers it is taken as "{longer}".')
 
-    def __init__(self, *args, generates_help=True, auto_grouping=True, **kwargs):
+    def __init__(self, *args, generates_help=True, auto_grouping=True, caches_help=False, caches_conversion=True,
+                 env_prefix=None, config_files=(), **kwargs):
+        self._frozen = None  # FrozenValues of clappy.frozen serving parse instead of passes, until it falls back
         self._adds_help = kwargs.get("add_help", True)
         kwargs["add_help"] = False
         ModifiedParser.__init__(self, *args, **kwargs)
 
         self._last_namespace = None
+        self._registered_actions = {}  # Dict[frozen args of add_argument, action]
+        self._pending_deferred: "List[Deferred]" = []
         self._subparsers_list = []
         self._subparsers_action = None
+        self._subcommands_by_name: "Dict[str, _SubCommand]" = {}  # including aliases
+        self._parent_parser: "Optional[_Parser]" = None  # set if this is parser of subcommand
+        self._dispatch_key = None  # state of args and actions when _dispatch_token was found, and the token
 
         self._printed_verbose_log = False
         self.auto_grouping = auto_grouping
-
-        self.return_on_help = self.default_returns_on_help
+        self.caches_help = caches_help
+        self.caches_conversion = caches_conversion
+        self._layered_defaults = {}  # Dict[normalized dest, value given by environment variables or config files]
+        self._has_layered_defaults = bool(env_prefix or config_files)
+        if env_prefix or config_files:
+            from . import config
+            self._layered_defaults = config.load(env_prefix, config_files)
+
+        self.return_on_help = _get_session().returns_on_help
         _HelpContextManager.__init__(self, alerts_to_use_with_block=generates_help)
 
 
     @classmethod
     def get_instance(cls, *args, **kwargs):
-        if not cls.singleton_instance:
-            parser = cls.singleton_instance = cls(*args, **kwargs)
+        session = _get_session()
+        if not session.parser:
+            parser = session.parser = cls(*args, **kwargs)
             if parser._adds_help:  # runs add_help after init to avoid RecursionError.
                 parser._add_argument("-h", "--help", help="show this help message and exit", action="help",
                                      not_group=True)
-        return cls.singleton_instance
+            if session.completion is not None:
+                from . import complete
+                complete.respond_at_exit(session)
+        return session.parser
+
+    @staticmethod
+    def _get_registration_key(args, is_flag, kwargs) -> tuple:
+        """Returns hashable key of arguments of add_argument, except caches_conversion not affecting the result."""
+        if len(args) == 1:
+            args = args[0].split(" ")
+        if not kwargs:
+            return tuple(args), is_flag, _NO_KWARGS
+        return tuple(args), is_flag, frozenset((name, utils.freeze(val)) for name, val in kwargs.items()
+                                               if name != "caches_conversion")
 
-    @utils.normalize_bound
-    @functools.lru_cache()
     def add_argument(self, *args, is_flag=False, **kwargs):
+        if self._frozen is not None:
+            self._thaw()
         if len(args) == 1:
             args = args[0].split(" ")
+        key = self._get_registration_key(args, is_flag, kwargs)
+        caches_conversion = kwargs.pop("caches_conversion", self.caches_conversion)
+        registered_action = self._registered_actions.get(key)
+        if utils.stats.enabled:
+            utils.stats.count("registration_cache_hit" if registered_action is not None else "registration_cache_miss")
+        if registered_action is not None:
+            return registered_action
+        if kwargs.get("nargs") == nargs.STREAM:
+            kwargs = self._get_kwargs_of_stream(args, kwargs)
         if is_flag:
             if kwargs.get("action", None) is None:
                 kwargs["action"] = "store_true"
             else:
+                from textwrap import dedent
                 raise ValueError(dedent(f"""\
                     {self.add_argument.__name__} got multiple values for action,
                     since is_flag=True is alias of action='store_true'."""))
@@ -132,6 +339,7 @@ class _Parser(_HelpContextManager, ModifiedParser):
             action = self._add_argument(*args, **kwargs)
         except argparse.ArgumentError as e:
             if e.message.startswith("conflicting"):
+                from textwrap import dedent
                 msg = dedent(f"""\
                     Tried to register same argument.
                     Usually, the cache is returned in such case. However, cache is not returned this time 
@@ -140,65 +348,300 @@ class _Parser(_HelpContextManager, ModifiedParser):
                 raise ValueError(msg) from e
             else:
                 raise e
-
-        def _parse_from_action():
-            if self.runs_for_help():
-                self.validate_usage_of_help()
-                return self.return_on_help
-            latest_namespace, unrecognized_args = self.parse_known_args()
-            logger.debug(f"Unrecognized args while parsing {action.dest}: {unrecognized_args}")
-            if self._last_namespace:
-                for attr in self._last_namespace.__dict__:
-                    last_time = getattr(self._last_namespace, attr)
-                    this_time = getattr(latest_namespace, attr)
-                    if last_time != this_time:
-                        if self._printed_verbose_log:
-                            message = self.VALUE_CHANGE_MESSAGE.format(
-                                changed_arg=attr, last_val=last_time, current_val=this_time, parsing_dest=action.dest)
-                        else:
-                            self._printed_verbose_log = True
-                            message = self.VERBOSE_VALUE_CHANGE_MESSAGE.format(
-                                parsing_dest=action.dest, name_of_changed_arg=attr,
-                                last_val=last_time, current_val=this_time)
-                        logger.error(message)
-            self._last_namespace = latest_namespace
-            return getattr(latest_namespace, action.dest)
-
-        action.parse = _parse_from_action
+        if self._layered_defaults:
+            self._apply_layered_default(action)
+        if caches_conversion:
+            self._actions_caching_conversion.add(action)
+        self._registered_actions[key] = action
         return action
 
+    def _parse_action(self, action):
+        """Returns the value of action parsed from args getting parsed."""
+        if self.runs_for_help():
+            self.validate_usage_of_help()
+            return self.return_on_help
+        latest_namespace, unrecognized_args = self._parse_known_args_sparse()
+        logger.debug("Unrecognized args while parsing %s: %s", action.dest, unrecognized_args)
+        self._log_value_changes(latest_namespace, action.dest)
+        self._last_namespace = latest_namespace
+        return getattr(latest_namespace, action.dest)
+
+    def _apply_layered_default(self, action):
+        """Replaces the default of action by the value of environment variables or config files if given."""
+        if action.dest is SUPPRESS:
+            return
+        if not action.option_strings and action.nargs not in (nargs.OPTIONAL, nargs.ZERO_OR_MORE):
+            return  # positionals which must be given stay so
+        from . import config
+        key = config.normalize(action.dest)
+        if key not in self._layered_defaults:
+            return
+        value = self._layered_defaults[key]
+        if isinstance(action, argparse._StoreConstAction):  # including store_true and store_false
+            if config.to_bool(value, action.dest):
+                action.default = action.const
+        elif isinstance(action, argparse._CountAction):
+            action.default = int(value)
+        elif action.nargs == 0:  # like help and version
+            return
+        elif (isinstance(action, argparse._AppendAction) or action.nargs in (nargs.ZERO_OR_MORE, nargs.ONE_OR_MORE)
+              or isinstance(action.nargs, int)):
+            values = utils.split_args(value) if isinstance(value, str) else list(value)
+            # defaults of list aren't converted by argparse, unlike defaults of str
+            action.default = [self._get_value(action, val) if isinstance(val, str) else val for val in values]
+        else:
+            action.default = value  # str is converted by type at the end of parse if the arg isn't given
+        action.required = False
+
+    def _make_action(self, args, is_flag, kwargs):
+        """Returns the action which add_argument would register for the arguments, without registering it."""
+        if len(args) == 1:
+            args = args[0].split(" ")
+        kwargs = {name: val for name, val in kwargs.items() if name != "caches_conversion"}
+        if kwargs.get("nargs") == nargs.STREAM:
+            kwargs = self._get_kwargs_of_stream(args, kwargs)
+        if is_flag:
+            kwargs.setdefault("action", "store_true")
+        if len(args) == 1 and args[0][:1] not in self.prefix_chars:
+            kwargs = self._get_positional_kwargs(*args, **kwargs)
+        else:
+            kwargs = self._get_optional_kwargs(*args, **kwargs)
+        return self._pop_action_class(kwargs)(**kwargs)
+
+    def _get_kwargs_of_stream(self, args, kwargs) -> dict:
+        """Returns kwargs of add_argument for nargs=STREAM. A positional of it reads stdin if not given."""
+        if kwargs.get("type") is not None:
+            raise ValueError(f"type can't be given with nargs={nargs.STREAM!r}, since the value becomes Stream.")
+        kwargs = dict(kwargs, type=Stream)
+        if args[0][:1] in self.prefix_chars:
+            del kwargs["nargs"]
+        else:
+            kwargs["nargs"] = argparse.OPTIONAL
+            kwargs.setdefault("default", Stream.STDIN)
+        return kwargs
+
+    def _log_value_changes(self, latest_namespace, parsing_dest):
+        """logger.error() for each value changed from the last parse.
+
+        Only dests written by args in the last or the latest namespace are compared,
+        since others keep their defaults in both. If the latest namespace is the last one updated incrementally,
+        only newly registered dest is written, so nothing can change."""
+        last_namespace = self._last_namespace
+        if last_namespace is None or last_namespace is latest_namespace:
+            return
+        last_written = getattr(last_namespace, "written", None)
+        latest_written = getattr(latest_namespace, "written", None)
+        if last_written is None or latest_written is None:
+            attrs = list(last_namespace.__dict__)
+        else:
+            attrs = sorted(latest_written, key=latest_written.get)
+            attrs.extend(attr for attr in last_written if attr not in latest_written)
+        for attr in attrs:
+            if not hasattr(last_namespace, attr):
+                continue
+            last_time = getattr(last_namespace, attr)
+            this_time = getattr(latest_namespace, attr)
+            if last_time != this_time:
+                if self._printed_verbose_log:
+                    message = self.VALUE_CHANGE_MESSAGE.format(
+                        changed_arg=attr, last_val=last_time, current_val=this_time, parsing_dest=parsing_dest)
+                else:
+                    self._printed_verbose_log = True
+                    message = self.VERBOSE_VALUE_CHANGE_MESSAGE.format(
+                        parsing_dest=parsing_dest, name_of_changed_arg=attr,
+                        last_val=last_time, current_val=this_time)
+                logger.error(message)
+
     def _add_argument(self, *args, not_group=False, **kwargs):
-        if not_group:
+        container = self if not_group else self._get_container()
+        if container is self:
             return super().add_argument(*args, **kwargs)
+        action = container.add_argument(*args, **kwargs)
+        if self.allow_abbrev and isinstance(action.container, _Group):
+            self._warn_about_prefixes(action)
+        return action
+
+    def _warn_about_prefixes(self, action):
+        """logger.warning() for option strings of action and of another group which are prefixes of each other."""
+        trie = self._get_option_trie()
+        for option_string in action.option_strings:
+            if trie is None:
+                related_option_strings = [registered for registered in self._option_string_actions
+                                          if registered != option_string and (registered.startswith(option_string)
+                                                                              or option_string.startswith(registered))]
+            else:
+                related_option_strings = trie.get_related(option_string)
+            for related in related_option_strings:
+                other = self._option_string_actions.get(related)
+                if other is None or other.container is action.container or not isinstance(other.container, _Group):
+                    continue
+                (shorter, shorter_group), (longer, longer_group) = sorted(
+                    [(option_string, action.container.title), (related, other.container.title)],
+                    key=lambda item: len(item[0]))
+                logger.warning(self.AMBIGUOUS_PREFIX_MESSAGE.format(
+                    shorter=shorter, shorter_group=shorter_group, longer=longer, longer_group=longer_group))
+
+    def _get_container(self):
+        """Returns the group of the innermost with block, the group of the calling module, or this parser."""
         active_group = _Group._get_active_group()
         if active_group:
-            action = active_group.add_argument(*args, **kwargs)
-        else:  # if not within with block
-            if not utils.is_called_from_main() and self.auto_grouping:
-                group = _Group.get()
-                action = group.add_argument(*args, **kwargs)
-            else:
-                action = super().add_argument(*args, **kwargs)
-        return action
+            return active_group
+        # if not within with block
+        caller_module = utils.get_caller_module()
+        if not caller_module.is_main and self.auto_grouping:
+            return _Group.get(name=caller_module.stem)
+        return self
 
     @classmethod
     @_auto_construct_parser
     def parse(cls, *args, is_flag=False, **kwargs):
-        action = cls.singleton_instance.add_argument(*args, is_flag=is_flag, **kwargs)
-        return action.parse()
+        session = _get_session()
+        parser = session.parser
+        if parser._frozen is not None and not session.active_groups:
+            from . import frozen
+            try:
+                value = parser._frozen.serve(cls._get_registration_key(args, is_flag, kwargs), (args, is_flag, kwargs),
+                                             parser._args_getting_parsed)
+            except frozen.Fallback:
+                parser._thaw()
+            else:
+                if utils.stats.enabled:
+                    utils.stats.count("frozen_parse")
+                return value
+        if utils.stats.enabled:
+            with utils.stats.measure("parse", utils.get_caller_module().name):
+                return parser._parse_action(parser.add_argument(*args, is_flag=is_flag, **kwargs))
+        return parser._parse_action(parser.add_argument(*args, is_flag=is_flag, **kwargs))
+
+    @classmethod
+    @_auto_construct_parser
+    def parse_lazy(cls, *args, is_flag=False, **kwargs):
+        parser = _get_session().parser
+        action = parser.add_argument(*args, is_flag=is_flag, **kwargs)
+        return parser._defer(action)
+
+    def _defer(self, action):
+        deferred = Deferred(self, action.dest)
+        self._pending_deferred.append(deferred)
+        return deferred
+
+    def resolve_deferred(self):
+        """Sets values of all pending Deferred by a pass of parse."""
+        pending, self._pending_deferred = self._pending_deferred, []
+        if not pending:
+            return
+        if self.runs_for_help():
+            self.validate_usage_of_help()
+            for deferred in pending:
+                deferred._value = self.return_on_help
+            return
+        latest_namespace, unrecognized_args = self._parse_known_args_sparse()
+        parsing_dests = ", ".join(deferred._dest for deferred in pending)
+        logger.debug("Unrecognized args while parsing %s: %s", parsing_dests, unrecognized_args)
+        self._log_value_changes(latest_namespace, parsing_dests)
+        self._last_namespace = latest_namespace
+        for deferred in pending:
+            deferred._value = getattr(latest_namespace, deferred._dest)
+
+    def parse_aside(self, args: list):
+        """
+        Returns namespace of args, keeping the last passes over args getting parsed to be reused.
+        The passes of parsers of subcommands are kept too, so that which subcommands are invoked doesn't change.
+        Values converted for args are not cached, since each of many args is parsed only once.
+        Arguments of decorated subcommands invoked by args are registered, and args are parsed again with them.
+        Unrecognized args are errors, same as parse_args.
+        """
+        states = {parser: (parser._last_record, parser._dispatch_token, len(parser._converted_values))
+                  for parser in self._get_built_parsers()}
+        try:
+            while True:
+                # plain Namespace, since writes need not be tracked for following registrations
+                namespace, unrecognized = self.parse_known_args(args, argparse.Namespace())
+                if not self._register_handlers_of_built_subcommands():
+                    break
+        except self.SubCommandNotFound as e:
+            (e.parser or self).error(e.message)
+        finally:
+            for parser in self._get_built_parsers():  # including ones built in this pass
+                parser._last_record, parser._dispatch_token, count_of_values = states.get(parser, (None, None, 0))
+                converted_values = parser._converted_values
+                while len(converted_values) > count_of_values:
+                    converted_values.popitem()  # values converted for args of this pass, which are added last
+        if unrecognized:
+            self.error(self.UNRECOGNIZED_ERROR_MESSAGE % " ".join(unrecognized))
+        return namespace
+
+    def _register_handlers_of_built_subcommands(self) -> bool:
+        """
+        Registers arguments of decorated subcommands whose parsers are built, but not their arguments yet.
+        Parsers built within a pass don't register them, so that required ones don't fail the pass.
+        Returns True if any of them is registered.
+        """
+        subcommands = [subcommand for parser in self._get_built_parsers()
+                       for subcommand in dict.fromkeys(parser._subcommands_by_name.values())
+                       if subcommand._parser is not None and subcommand.handler is not None
+                       and not subcommand._registered_handler]
+        for subcommand in subcommands:
+            subcommand.get_parser()
+        return bool(subcommands)
+
+    def _get_built_parsers(self) -> "List[_Parser]":
+        """Returns this parser and parsers of its subcommands built so far, recursively."""
+        parsers = [self]
+        for parser in parsers:
+            for subcommand in dict.fromkeys(parser._subcommands_by_name.values()):  # without aliases
+                if subcommand._parser is not None:
+                    parsers.append(subcommand._parser)
+        return parsers
+
+    def _load_frozen(self, arguments_of_parser):
+        """Serves parse by the frozen parser generated by python -m clappy.freeze for the script, if it's current."""
+        if _get_session().completion is not None:
+            return  # completion needs the registered actions
+        main_file = getattr(sys.modules.get("__main__"), "__file__", None)
+        if main_file is None or not os.path.isfile(utils.get_path_of_frozen(main_file)):
+            return
+        from . import frozen
+        self._frozen = frozen.load(utils.get_path_of_frozen(main_file), arguments_of_parser, len(self._actions))
+
+    def _thaw(self):
+        """
+        Registers the calls of parse served by the frozen parser, and parses dynamically from then on.
+        Values served so far become the last namespace, so that the dynamic parser logs their changes.
+        """
+        frozen_values, self._frozen = self._frozen, None
+        if frozen_values is None:
+            return
+        if frozen_values.served:
+            from . import frozen
+            try:
+                values, _ = frozen_values.get_known(self._args_getting_parsed)
+            except frozen.Fallback:
+                pass  # nothing was served for the args
+            else:
+                self._last_namespace = argparse.Namespace(**values)
+        active_groups = _get_session().active_groups
+        for args, is_flag, kwargs, group_title in frozen_values.served:
+            container = self if group_title is None else _Group.get(name=group_title)
+            active_groups.append(container)  # so that _get_container returns it without walking frames
+            try:
+                self.add_argument(*args, is_flag=is_flag, **kwargs)
+            finally:
+                active_groups.pop()
 
     def add_argument_group(self, *args, **kwargs):
+        if self._frozen is not None:
+            self._thaw()
         group = _Group(self, *args, **kwargs)
         self._action_groups.append(group)
         return group
 
-    def parse_known_args(self, args=None, namespace=None):
-        args = args or self._args_getting_parsed
-        result = super().parse_known_args(args, namespace)
-        for act in self._actions:
-            if hasattr(act, "parsed_currently"):
-                act.parsed_currently = False
-        return result
+    def _parse_known_args_sparse(self, args=None, namespace=None):
+        if args is None and namespace is None:
+            return self.parse_known_args_incrementally(self._args_getting_parsed)
+        if args is None:  # subparsers give empty args if nothing follows subcommand
+            args = self._args_getting_parsed
+        return super()._parse_known_args_sparse(args, namespace)
 
     @staticmethod
     def _get_action_name(argument):
@@ -213,25 +656,125 @@ class _Parser(_HelpContextManager, ModifiedParser):
         else:
             return None
 
-    def add_subparsers(self, *, title="subcommand", parser_class=None, **kwargs):
-        parser_class = parser_class or _SubCommand
-        self._subparsers_action = super().add_subparsers(title=title, parser_class=parser_class, **kwargs)
+    def add_subparsers(self, *, title="subcommand", parser_class=None, action=None, **kwargs):
+        if self._frozen is not None:
+            self._thaw()
+        parser_class = parser_class or _SubCommandParser
+        action = action or _LazySubParsersAction
+        self._subparsers_action = super().add_subparsers(title=title, parser_class=parser_class, action=action,
+                                                         **kwargs)
         return self._subparsers_action
 
+    def _get_invoked_subcommand(self) -> "Optional[_SubCommand]":
+        """
+        Returns the subcommand invoked in args, or None.
+
+        The token at the position of subcommand in args is found by a pass of parse of the main parser,
+        and kept until args or actions of this parser or its parents change. Registering subcommands doesn't change
+        the position, so the pass runs only once for if/elif chain of subcommands and following calls are O(1) lookups.
+        """
+        session = _get_session()
+        main_parser = session.parser
+        args = main_parser._args_getting_parsed
+        if session.completion is not None:
+            from . import complete
+            return self._subcommands_by_name.get(complete.get_dispatch_token(self, args))
+        count_of_actions = 0
+        parser = self
+        while parser is not None:
+            count_of_actions += len(parser._actions)  # actions are never removed, so the sum changes on any change
+            parser = parser._parent_parser
+        dispatch_key = self._dispatch_key
+        if dispatch_key is None or dispatch_key[0] is not args or dispatch_key[1:3] != (len(args), count_of_actions):
+            try:
+                main_parser._parse_known_args_sparse()
+            except self.SubCommandNotFound:
+                pass
+            # the token is kept in the key, since passes over other args like parse_many overwrite _dispatch_token
+            dispatch_key = self._dispatch_key = args, len(args), count_of_actions, self._dispatch_token
+        return self._subcommands_by_name.get(dispatch_key[3])
+
+    def _get_invoked_subcommands(self) -> "List[_SubCommand]":
+        """Returns invoked subcommands from this parser to the deepest one, whose parsers are built."""
+        invoked_subcommands = []
+        parser = self
+        while parser._subparsers_action is not None:
+            invoked_subcommand = parser._get_invoked_subcommand()
+            if invoked_subcommand is None:
+                break
+            invoked_subcommands.append(invoked_subcommand)
+            parser = invoked_subcommand.get_parser()
+        return invoked_subcommands
+
+    def _print_help_of(self, parser: "_Parser"):
+        """Prints help of this parser or its subcommand. If caches_help, the rendered help is cached on disk."""
+        if not self.caches_help:
+            parser.print_help()
+            return
+        import shutil
+        from . import cache, __version__
+        key = parser.prog, shutil.get_terminal_size().columns, sys.version_info[:2], __version__
+        fingerprint = cache.make_fingerprint(self._describe_for_help())
+        help_text = cache.load("help", key, fingerprint)
+        if help_text is None:
+            help_text = parser.format_help()
+            cache.store("help", key, fingerprint, help_text)
+        parser._print_message(help_text, sys.stdout)
+
+    def _describe_for_help(self) -> tuple:
+        """Returns all registered things affecting help, including subcommands, as nested tuples."""
+        def describe(value):
+            if isinstance(value, (str, int, float, bool, type(None))):
+                return value
+            elif isinstance(value, (list, tuple, set, frozenset)):
+                return tuple(describe(val) for val in value)
+            elif isinstance(value, dict):
+                return tuple((describe(key), describe(val)) for key, val in value.items())
+            elif isinstance(value, _SubCommand):
+                return value._describe_for_help()
+            elif isinstance(value, argparse.ArgumentParser):
+                return value._describe_for_help() if isinstance(value, _Parser) else repr(value)
+            return getattr(value, "__qualname__", None) or repr(value)
+
+        actions = tuple(
+            (type(act).__name__, act.option_strings, act.dest, act.nargs, act.metavar, act.help, act.required,
+             describe(act.const), describe(act.default), describe(act.type), describe(act.choices),
+             describe([(choice.dest, choice.metavar, choice.help) for choice in getattr(act, "_choices_actions", [])]))
+            for act in self._actions)
+        index_of_action = {act: i for i, act in enumerate(self._actions)}
+        groups = tuple(
+            (group.title, group.description, tuple(index_of_action[act] for act in group._group_actions))
+            for group in self._action_groups)
+        mutually_exclusive_groups = tuple(
+            (group.required, tuple(index_of_action[act] for act in group._group_actions))
+            for group in self._mutually_exclusive_groups)
+        return (self.prog, self.usage, self.description, self.epilog, self.prefix_chars,
+                describe(self.formatter_class), actions, groups, mutually_exclusive_groups)
+
     def on_end_with_blocks(self):
+        completion = _get_session().completion
+        if completion is not None:
+            from . import complete
+            complete.respond(self, completion)
+        if self._frozen is not None:
+            from . import frozen
+            try:
+                _, extras = self._frozen.get_known(self._args_getting_parsed)
+                if not extras:
+                    return  # all args are recognized, and help isn't asked
+            except frozen.Fallback:
+                pass
+            self._thaw()
+        self.resolve_deferred()
+        invoked_subcommands = self._get_invoked_subcommands()  # registers arguments of their handlers too
         if self.runs_for_help():
-            for subparser in self._subparsers_list:
-                if subparser.invoked:
-                    subparser.print_help()
-                    break
-            else:
-                self.print_help()
+            self._print_help_of(invoked_subcommands[-1].get_parser() if invoked_subcommands else self)
             if self.exits_after_help_message:
                 exit()
         else:
-            parsed, unrecognized = self.parse_known_args()
+            parsed, unrecognized = self._parse_known_args_sparse()
             if unrecognized:
-                logger.error(_Parser.singleton_instance.UNRECOGNIZED_ERROR_MESSAGE % unrecognized)
+                logger.error(self.UNRECOGNIZED_ERROR_MESSAGE % unrecognized)
 
 
 # noinspection PyIncorrectDocstring
@@ -261,10 +804,112 @@ def parse(*args, is_flag=False, **kwargs):
         You can get all acceptable patterns as string like following.
 
         e.g. clappy.nargs.ONE_OR_MORE
+    caches_conversion: bool, default caches_conversion of get_parser
+        Represents if the result of type for each arg is cached, since the arg is parsed again on each parse.
+        Give False if type is not pure, e.g. it has side effects or returns objects which are mutated later.
     **kwargs:
         Same as argparse.ArgumentParser.add_argument
     """
-    return _Parser.singleton_instance.parse(*args, is_flag=is_flag, **kwargs)
+    return _get_session().parser.parse(*args, is_flag=is_flag, **kwargs)
+
+
+@_auto_construct_parser
+def parse_lazy(*args, is_flag=False, **kwargs) -> Deferred:
+    """
+    Same as parse, but returns Deferred instead of the value.
+    Its value is parsed together with all other pending Deferred in a pass on the first read of Deferred.value,
+    or at the end of with block of get_parser.
+    It's suitable for modules registering many arguments at import time, but reading them much later.
+
+    Examples
+    --------
+    >>> foo = clappy.parse_lazy("--foo")
+    >>> bar = clappy.parse_lazy("--bar", is_flag=True)
+    >>> print(foo.value)  # both of --foo and --bar are parsed here.
+    """
+    return _get_session().parser.parse_lazy(*args, is_flag=is_flag, **kwargs)
+
+
+@_auto_construct_parser
+def parse_many(argvs, processes=None, chunksize=256):
+    """
+    Yields namespace for each of argvs, parsed by the arguments registered already.
+    Args getting parsed and the results of parse for them are not changed.
+    It's suitable for parsing many command lines, e.g. messages to a bot, with the same arguments.
+
+    Examples
+    --------
+    >>> clappy.parse("--verbose", is_flag=True)
+    >>> clappy.parse("command")
+    >>> for namespace in clappy.parse_many(["deploy --verbose", ["stop"]]):
+    >>>     print(namespace.command, namespace.verbose)
+
+    Parameters
+    ----------
+    argvs: Iterable of list or str
+        str is split into args like shell does, which is same as shlex.split.
+    processes: int
+        If given, argvs are parsed in this number of processes, yielding namespaces in the order of argvs.
+        It's available only where processes can be forked, since types of arguments may not be pickled.
+        Values of namespaces must be picklable instead.
+    chunksize: int
+        Number of argvs sent to a process at once if processes is given.
+    """
+    parser = _get_session().parser
+    parser._thaw()
+    if processes is None:
+        return (parser.parse_aside(_to_args(argv)) for argv in argvs)
+    return _parse_many_in_processes(parser, argvs, processes, chunksize)
+
+
+def _to_args(argv) -> list:
+    return utils.split_args(argv) if isinstance(argv, str) else list(argv)
+
+
+def _parse_many_in_processes(parser: _Parser, argvs, processes, chunksize):
+    import multiprocessing
+    try:
+        context = multiprocessing.get_context("fork")
+    except ValueError:
+        raise ValueError("processes of parse_many is available only where processes can be forked.") from None
+    # initargs are not pickled on fork, so the parser is inherited as it is.
+    with context.Pool(processes, initializer=_set_parser_of_process, initargs=(parser,)) as pool:
+        for namespace in pool.imap(_parse_in_process, argvs, chunksize):
+            if isinstance(namespace, _ExitOfProcess):
+                sys.stderr.write(namespace.message)
+                raise SystemExit(namespace.code)
+            yield namespace
+
+
+_parser_of_process: "Optional[_Parser]" = None  # parser used by _parse_in_process in processes of parse_many
+
+
+def _set_parser_of_process(parser: _Parser):
+    global _parser_of_process
+    _parser_of_process = parser
+
+
+class _ExitOfProcess:
+    """
+    Returned by _parse_in_process instead of SystemExit, which would kill the worker and hang the pool.
+    The error is printed and raised again by the parent process.
+    """
+    __slots__ = ("code", "message")
+
+    def __init__(self, code, message: str):
+        self.code = code
+        self.message = message
+
+
+def _parse_in_process(argv):
+    import contextlib
+    import io
+    stderr = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(stderr):
+            return _parser_of_process.parse_aside(_to_args(argv))
+    except SystemExit as e:
+        return _ExitOfProcess(e.code, stderr.getvalue())
 
 
 @_auto_construct_parser
@@ -290,13 +935,72 @@ def get_group(name=None, description=None) -> "_Group":
     return _Group.get(name=name, description=description)
 
 
+def stats(reset=False) -> dict:
+    """
+    Returns counts of calls and cumulative seconds of work done by clappy, collected after enable_stats(),
+    or from the start if $CLAPPY_STATS is set. Some of them have counts by key too.
+
+    full_pass: passes of parse_known_args over all args, by prog of parser. Nested passes of subcommands included.
+    reused_pass, incremental_pass: parses returning the last pass as it is, or updated only for a new option.
+    frame_walk: walks of stack frames to find the module calling clappy.
+    frozen_parse: calls of clappy.parse served by the frozen parser generated by python -m clappy.freeze.
+    registration_cache_hit, registration_cache_miss: lookups of arguments registered already.
+    type_conversion: conversions of args by type of action, by name of action like --foo.
+    type_conversion_cache_hit: conversions skipped since the result for the arg is cached, by name of action.
+    subcommand_invoked: evaluations of _SubCommand.invoked not cached yet, by name of subcommand.
+    parse: calls of clappy.parse, by __name__ of the calling module.
+    arg_file_read, arg_file_cache_hit: expansions of @file by fromfile_prefix_chars, by path.
+
+    Parameters
+    ----------
+    reset: bool
+        If True, clears the collected stats after returning them.
+    """
+    result = utils.stats.as_dict()
+    if reset:
+        utils.stats.reset()
+    return result
+
+
+def enable_stats(enabled=True):
+    """Starts or stops collecting stats returned by clappy.stats(). It's disabled in default to cost nothing."""
+    utils.stats.enabled = enabled
+
+
+@_auto_construct_parser
+def get_exclusive_group(name=None, required=False) -> "_ExclusiveGroup":
+    # noinspection PyUnresolvedReferences
+    """
+        Returns mutually exclusive group which can be a context manager like get_group.
+        Arguments parsed in its with block can't be given together.
+        The group belongs to the group of outer with block, or the group of the module if auto grouping.
+
+        Examples
+        --------
+        >>> with get_exclusive_group():
+        >>>     verbose = clappy.parse("--verbose", is_flag=True)
+        >>>     quiet = clappy.parse("--quiet", is_flag=True)  # error if --verbose and --quiet are given.
+
+        Parameters
+        ----------
+        name: str
+            If same name is specified, same instance is returned even from different modules.
+            If None, new group is created.
+        required: bool
+            Represents if one of the arguments in the group is required.
+            It's checked at the end of the with block, after all the arguments are registered.
+        """
+    return _ExclusiveGroup.get(name=name, required=required)
+
+
 def clear_parser():
-    """Reset parser so that you can recreate new parser with different args."""
-    _Parser.singleton_instance = None
+    """Reset parser of the current session so that you can recreate new parser with different args.
+    Groups and subcommands of the parser are dropped too, so that nothing of it is kept in memory."""
+    _get_session().reset()
 
 
-@functools.lru_cache()
-def get_parser(*args, generates_help=True, auto_grouping=True, **kwargs):
+def get_parser(*args, generates_help=True, auto_grouping=True, caches_help=False, caches_conversion=True,
+               env_prefix=None, config_files=(), **kwargs):
     """
     Returns already existing parser, or newly constructed one.
     The parser is usually used as context manager for auto help generation.
@@ -327,17 +1031,36 @@ def get_parser(*args, generates_help=True, auto_grouping=True, **kwargs):
         Represents if clappy will automatically allocate command line argument in a group.
         In default, clappy groups when the argument is set not in __main__ module and has not specified group.
         The name of group automatically allocated becomes the name of module.
+    caches_help: bool
+        Represents if clappy will cache rendered help in the user cache directory, or $CLAPPY_CACHE_DIR if set.
+        The cache is used while registered arguments, groups, subcommands and the width of terminal are same.
+    caches_conversion: bool
+        Represents if clappy will cache the result of type for each arg and action while the parser is used.
+        It can be overridden for each argument by the same keyword argument of parse.
+    env_prefix: str
+        If given, environment variables named this prefix + dest in upper case, like APP_LOG_LEVEL for --log-level,
+        override defaults of arguments. Values of flags are like 1, true, yes or on, and lists are split like shell.
+    config_files: list of str
+        Paths of INI files, or TOML files if the suffix is .toml, whose keys in any section override defaults of
+        arguments of the same dest. Later files override earlier ones, and environment variables override them all.
+        Missing files are skipped. Environment variables and files are read only once when the parser is built.
     """
-
-    if _Parser.singleton_instance is None:
-        _Parser.singleton_instance = _Parser.get_instance(
-            *args, generates_help=generates_help, auto_grouping=auto_grouping, **kwargs
+    session = _get_session()
+    arguments = utils.freeze((args, generates_help, auto_grouping, caches_help, caches_conversion, env_prefix,
+                              config_files, kwargs))
+    if session.parser is None:
+        session.parser = _Parser.get_instance(
+            *args, generates_help=generates_help, auto_grouping=auto_grouping, caches_help=caches_help,
+            caches_conversion=caches_conversion, env_prefix=env_prefix, config_files=config_files, **kwargs
         )
-    else:
-        if args or kwargs:
-            logger.warning(f"Instanced parser already exists, but you ran {get_parser.__name__} with {args, kwargs}."
-                           f"This func returned the existing parser, and your {args} and {kwargs} were ignored.")
-    return _Parser.singleton_instance
+        session.arguments_of_parser = arguments
+        session.parser._load_frozen(arguments)
+    elif (args or kwargs) and arguments != session.arguments_of_parser:
+        logger.warning(f"Instanced parser already exists, but you ran {get_parser.__name__} with {args, kwargs}."
+                       f"This func returned the existing parser, and your {args} and {kwargs} were ignored.")
+    if session.parser._frozen is not None and session.parser._frozen.served:
+        session.parser._thaw()  # the parser may be used directly, so it needs the arguments
+    return session.parser
 
 
 def auto_help_generator(auto_grouping=True):
@@ -347,58 +1070,107 @@ def auto_help_generator(auto_grouping=True):
     return get_parser(auto_grouping=auto_grouping)
 
 
-_Nargs = namedtuple("Nargs", "OPTIONAL ZERO_OR_MORE ONE_OR_MORE")
-nargs = _Nargs(OPTIONAL=argparse.OPTIONAL, ZERO_OR_MORE=argparse.ZERO_OR_MORE, ONE_OR_MORE=argparse.ONE_OR_MORE)
+class _Nargs:
+    OPTIONAL = argparse.OPTIONAL
+    ZERO_OR_MORE = argparse.ZERO_OR_MORE
+    ONE_OR_MORE = argparse.ONE_OR_MORE
+    STREAM = "stream"  # only for clappy. The value becomes Stream.
+
 
-_actions = (
-    'STORE',
-    'STORE_CONST',
-    'STORE_TRUE',
-    'STORE_FALSE',
-    'APPEND',
-    'APPEND_CONST',
-    'COUNT',
-    'HELP',
-    'VERSION',
-    'PARSERS',
-    'EXTEND')
-_Action = namedtuple("_Action", _actions)
-action = _Action(**{name: name.lower() for name in _actions})
+nargs = _Nargs()
+
+
+class _Action:
+    STORE = 'store'
+    STORE_CONST = 'store_const'
+    STORE_TRUE = 'store_true'
+    STORE_FALSE = 'store_false'
+    APPEND = 'append'
+    APPEND_CONST = 'append_const'
+    COUNT = 'count'
+    HELP = 'help'
+    VERSION = 'version'
+    PARSERS = 'parsers'
+    EXTEND = 'extend'
+
+
+action = _Action()
 
 
 # noinspection PyUnresolvedReferences,PyProtectedMember
-class _Group(argparse._ArgumentGroup):
-    active_groups: List["_Group"] = []
-    title_group_dict: Dict = {}  # Dict[str:"_GroupForWith"]
+class _Group(ArgumentGroup):
 
     def __enter__(self):
-        _Group.active_groups.append(self)
+        _get_session().active_groups.append(self)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        _Group.active_groups.remove(self)
+        _get_session().active_groups.remove(self)
 
     @classmethod
     def _get_active_group(cls):
-        if cls.active_groups:
-            return cls.active_groups[-1]
+        active_groups = _get_session().active_groups
+        if active_groups:
+            return active_groups[-1]
         else:
             return None
 
     @classmethod
     def get(cls, name=None, description=None):
-        parser = _Parser.singleton_instance
+        session = _get_session()
+        parser = session.parser
         if name is None and parser.auto_grouping:
-            if not utils.is_called_from_main():
-                name = utils.get_caller_name(4)
+            caller_module = utils.get_caller_module()
+            if not caller_module.is_main:
+                name = caller_module.stem
 
-        cached_group = cls.title_group_dict.get(name, None)
+        cached_group = session.title_group_dict.get(name, None)
 
         if cached_group is not None:
             return cached_group
 
         group = parser.add_argument_group(name, description)
-        cls.title_group_dict[name] = group
+        session.title_group_dict[name] = group
+        return group
+
+
+class _ExclusiveGroup(ExclusiveGroup):
+    """
+    Mutually exclusive group as context manager.
+    If required, it's required only after its with block, since its members are registered one by one.
+    """
+
+    def __init__(self, container, required=False):
+        super().__init__(container, required=False)
+        self._requires = required
+
+    def __enter__(self):
+        _get_session().active_groups.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        session = _get_session()
+        session.active_groups.remove(self)
+        if self._requires and not self.required and exc_type is None:
+            self.required = True
+            ModifiedParser._count_registration()
+            parser = session.parser
+            if not parser.runs_for_help():
+                parser._parse_known_args_sparse()  # fails if none of the members is given
+
+    @classmethod
+    def get(cls, name=None, required=False):
+        session = _get_session()
+        session.parser._thaw()
+        cached_group = session.name_exclusive_group_dict.get(name, None)
+        if cached_group is not None:
+            return cached_group
+
+        container = session.parser._get_container()
+        group = cls(container, required=required)
+        container._mutually_exclusive_groups.append(group)
+        if name is not None:
+            session.name_exclusive_group_dict[name] = group
         return group
 
 
@@ -407,42 +1179,167 @@ def set_name_of_main_script(filename: str):
     utils.filename_of_main = filename
 
 
-def set_args_getting_parsed(args: Union[List[str], str]):
-    """Clappy will parse not commandline arguments but given 'args' here."""
+def set_args_getting_parsed(args: "Union[List[str], str]"):
+    """Clappy will parse not commandline arguments but given 'args' here. str is split like shell does."""
     if isinstance(args, str):
-        args = args.split(" ")
-    _Parser._default_args_getting_parsed = args
-    active_parser = _Parser.singleton_instance
+        args = utils.split_args(args)
+    session = _get_session()
+    session.args_getting_parsed = args
+    active_parser = session.parser
     if active_parser:
         active_parser._args_getting_parsed = args
         active_parser._last_namespace = None
 
 
 def set_return_value_on_help(val):
-    _Parser.default_returns_on_help = val
-    if _Parser.singleton_instance:
-        _Parser.singleton_instance.return_on_help = val
+    session = _get_session()
+    session.returns_on_help = val
+    if session.parser:
+        session.parser.return_on_help = val
 
 
 # noinspection PyUnresolvedReferences,PyProtectedMember
-class _SubCommand(_Parser):
-    name_of_subcommand_group = "commands"
-    active_instance = None
+class _SubCommandParser(_Parser):
+    """Parser of a subcommand, built by _SubCommand only when the subcommand is invoked."""
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._invoked = None
         if self._adds_help:
             self._add_argument("-h", "--help", action="help", help="show this help message and exit")
 
+    def _add_argument(self, *args, **kwargs):
+        return argparse.ArgumentParser.add_argument(self, *args, **kwargs)
+
+
+# noinspection PyProtectedMember
+class _LazySubParsersAction(SubParsersAction):
+    """
+    Subparsers action keeping _SubCommand in place of its parser until the subcommand is invoked.
+    Help of the parent lists subcommands by name and help without building their parsers.
+    """
+
+    def add_subcommand(self, subcommand: "_SubCommand"):
+        names = (subcommand.name, *subcommand.aliases)
+        for name in names:
+            if name in self._name_parser_map:
+                raise argparse.ArgumentError(self, f"conflicting subparser: {name}")
+        self._choices_actions.append(self._ChoicesPseudoAction(subcommand.name, subcommand.aliases, subcommand.help))
+        for name in names:
+            self._name_parser_map[name] = subcommand
+
+    def build_parser(self, subcommand: "_SubCommand") -> _SubCommandParser:
+        """Same as add_parser, except that the subcommand is listed for help already."""
+        kwargs = dict(subcommand.kwargs)
+        if kwargs.get("prog") is None:
+            kwargs["prog"] = f"{self._prog_prefix} {subcommand.name}"
+        parser = self._parser_class(**kwargs)
+        for name in (subcommand.name, *subcommand.aliases):
+            self._name_parser_map[name] = parser
+        return parser
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        subcommand = self._name_parser_map.get(values[0])
+        if isinstance(subcommand, _SubCommand):
+            subcommand.get_parser(registers_handler=False)
+        super().__call__(parser, namespace, values, option_string)
+
+
+class _SubCommand:
+    """
+    Subcommand returned by clappy.subcommand(). bool() represents if the subcommand is invoked or not.
+
+    Only its name and help are registered to the parent parser,
+    and its parser is built when it's invoked. So arguments of subcommands not invoked are never registered,
+    and parse() returns their defaults instead.
+    """
+    name_of_subcommand_group = "commands"
+
+    # noinspection PyShadowingBuiltins
+    def __init__(self, parent_parser: "Optional[_Parser]", name: str, help=None, aliases=(), **kwargs):
+        self._parent_parser = parent_parser  # None if the parent subcommand is not invoked
+        self.name = name
+        self.help = help
+        self.aliases = tuple(aliases)
+        self.kwargs = kwargs
+        self._parser: "Optional[_SubCommandParser]" = None
+        self._invoked = None
+        self.handler: "Optional[_Handler]" = None  # set if made by decorating a function
+        self._registered_handler = False
+
+    def get_parser(self, registers_handler=True) -> _SubCommandParser:
+        """
+        Returns the parser of this subcommand, building it on the first call.
+        Arguments of the handler are registered too, unless registers_handler is False.
+        It's False within a pass, where required arguments of the handler would fail the pass before help.
+        """
+        if self._parser is None:
+            parent_parser = self._parent_parser
+            if parent_parser is None:
+                raise self.NotRegistered(f"Subcommand {self.name} is not registered, since its parent is not invoked.")
+            parser = self._parser = parent_parser._subparsers_action.build_parser(self)
+            parser._parent_parser = parent_parser
+            if "caches_conversion" not in self.kwargs:
+                parser.caches_conversion = parent_parser.caches_conversion
+            parser._layered_defaults = parent_parser._layered_defaults
+            parser.set_defaults(_invoked_command=self.name)
+        if registers_handler and self.handler is not None and not self._registered_handler:
+            self._registered_handler = True
+            self.handler.register(self._parser)
+        return self._parser
+
     def parse(self, *args, is_flag=False, **kwargs):
-        main_parser = _Parser.singleton_instance
-        action = _Parser.add_argument(self, *args, is_flag=is_flag, **kwargs)
-        namespace, _ = main_parser.parse_known_args()
+        if not self.invoked:
+            return self._get_default(args, is_flag, kwargs)
+        main_parser = _get_session().parser
+        action = _Parser.add_argument(self.get_parser(), *args, is_flag=is_flag, **kwargs)
+        if main_parser.runs_for_help():
+            return main_parser.return_on_help
+        namespace, _ = main_parser._parse_known_args_sparse()
         return getattr(namespace, action.dest)
 
-    def _add_argument(self, *args, **kwargs):
-        return argparse.ArgumentParser.add_argument(self, *args, **kwargs)
+    def parse_lazy(self, *args, is_flag=False, **kwargs):
+        main_parser = _get_session().parser
+        if not self.invoked:
+            deferred = Deferred(main_parser, kwargs.get("dest") or args[0].split(" ")[-1].lstrip("-"))
+            deferred._value = self._get_default(args, is_flag, kwargs)
+            return deferred
+        action = _Parser.add_argument(self.get_parser(), *args, is_flag=is_flag, **kwargs)
+        return main_parser._defer(action)
+
+    def _get_default(self, args, is_flag, kwargs):
+        """
+        Returns the value of an argument which is not given, same as the parser of this subcommand would return.
+        Its action is made without registering it, only if the default may be converted by type
+        or replaced by environment variables or config files.
+        """
+        main_parser = _get_session().parser
+        if not main_parser._layered_defaults and not isinstance(kwargs.get("default"), str):
+            if "default" in kwargs:
+                return kwargs["default"]
+            action_name = _Action.STORE_TRUE if is_flag else kwargs.get("action")
+            return {_Action.STORE_TRUE: False, _Action.STORE_FALSE: True}.get(action_name)
+        action = main_parser._make_action(args, is_flag, kwargs)
+        main_parser._apply_layered_default(action)
+        if isinstance(action.default, str) and (action.option_strings or action.nargs == nargs.OPTIONAL):
+            try:
+                return main_parser._get_value(action, action.default)
+            except argparse.ArgumentError as e:
+                main_parser.error(str(e))
+        return action.default
+
+    # noinspection PyShadowingBuiltins
+    def subcommand(self, name=None, *, help=None, **kwargs) -> "_SubCommand":
+        """
+        Returns nested subcommand of this subcommand. It's registered only if this subcommand is invoked.
+        It decorates a function like clappy.subcommand too.
+        """
+        if name is None:
+            return functools.partial(self.subcommand, help=help, **kwargs)
+        if isinstance(name, types.FunctionType):
+            return _decorate_subcommand(self.subcommand, name, dict(kwargs, help=help) if help else kwargs)
+        if not self.invoked:
+            return _SubCommand(None, name, help=help, **kwargs)
+        return self.create(name, help=help, parent_parser=self.get_parser(), **kwargs)
 
     def __bool__(self):
         return self.invoked
@@ -450,26 +1347,33 @@ class _SubCommand(_Parser):
     @property
     def invoked(self):
         if self._invoked is None:
-            self._invoked = False
-            try:
-                namespace, _ = _Parser.singleton_instance.parse_known_args()
-            except self.SubCommandNotFound:
-                pass
-            else:
-                if namespace._invoked_command == self._defaults["_invoked_command"]:
-                    self._invoked = True
+            if utils.stats.enabled:
+                utils.stats.count("subcommand_invoked", self.name)
+            parent_parser = self._parent_parser
+            self._invoked = parent_parser is not None and parent_parser._get_invoked_subcommand() is self
         return self._invoked
 
+    def _describe_for_help(self) -> tuple:
+        parser = self._parser._describe_for_help() if self._parser is not None else None
+        return self.name, self.help, self.aliases, parser
+
     class MultipleActivated(Exception):
         pass
 
+    class NotRegistered(Exception):
+        pass
+
     def __enter__(self):
-        if self.active_instance:
+        session = _get_session()
+        if session.active_subcommand:
             raise self.MultipleActivated("Already in with block of another subcommand.")
-        self.__class__.active_instance = self
+        session.active_subcommand = self
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        session = _get_session()
+        if session.active_subcommand is self:
+            session.active_subcommand = None
         return True
 
     @classmethod
@@ -479,91 +1383,177 @@ class _SubCommand(_Parser):
     # noinspection PyShadowingBuiltins
     @classmethod
     @_auto_construct_parser
-    def create(cls, name, *, help=None, **kwargs):
-        active_parser = _Parser.singleton_instance
-        if not active_parser._subparsers_list:
-            active_parser.add_subparsers(title=cls.name_of_subcommand_group)
-        subcommand = active_parser._subparsers_action.add_parser(name, help=help, **kwargs)
-        subcommand.set_defaults(_invoked_command=name)
-
-        active_parser._subparsers_list.append(subcommand)
+    def create(cls, name, *, help=None, parent_parser=None, **kwargs):
+        parent_parser = parent_parser or _get_session().parser
+        if parent_parser._subparsers_action is None:
+            parent_parser.add_subparsers(title=cls.name_of_subcommand_group)
+        subcommand = cls(parent_parser, name, help=help, **kwargs)
+        parent_parser._subparsers_action.add_subcommand(subcommand)
+        ModifiedParser._count_registration()
+
+        parent_parser._subparsers_list.append(subcommand)
+        for name_or_alias in (name, *subcommand.aliases):
+            parent_parser._subcommands_by_name[name_or_alias] = subcommand
         return subcommand
 
 
+class _Handler:
+    """
+    Function decorated by clappy.subcommand, called with args of its subcommand by clappy.dispatch().
+
+    Arguments are made from the signature of the function, when the parser of its subcommand is built.
+    The signature is read from the code object of the function instead of inspect, which costs its import.
+    Parameters before * are positionals, and *args takes the rest of them.
+    Keyword-only parameters are options like --dry-run, and required if they don't have defaults.
+    Annotation or default of bool makes a flag, and other annotations or defaults of int and float are the type.
+    **kwargs is not filled by args.
+    """
+    __slots__ = ("func", "_arguments")
+    _TYPES_BY_NAME = {"str": str, "int": int, "float": float, "bool": bool}  # for annotations of PEP 563
+    _CO_VARARGS = 0x04
+
+    def __init__(self, func: "types.FunctionType"):
+        self.func = func
+        self._arguments = None  # List[(name of parameter, kind, args of add_argument, kwargs of add_argument)]
+
+    def get_arguments(self) -> list:
+        """Returns arguments made from the signature, which are made only once for the function."""
+        if self._arguments is None:
+            func = self.func
+            while hasattr(func, "__wrapped__"):  # functools.wraps, same as inspect.signature
+                func = func.__wrapped__
+            code = func.__code__
+            names = code.co_varnames
+            count_of_positionals = code.co_argcount
+            defaults = func.__defaults__ or ()
+            defaults = dict(zip(names[count_of_positionals - len(defaults):count_of_positionals], defaults))
+            defaults.update(func.__kwdefaults__ or {})
+            annotations = getattr(func, "__annotations__", None) or {}
+            arguments = [self._make_argument(name, "positional", defaults, annotations)
+                         for name in names[:count_of_positionals]]
+            end_of_keywords = count_of_positionals + code.co_kwonlyargcount
+            if code.co_flags & self._CO_VARARGS:
+                arguments.append(self._make_argument(names[end_of_keywords], "var_positional", defaults, annotations))
+            arguments.extend(self._make_argument(name, "keyword", defaults, annotations)
+                             for name in names[count_of_positionals:end_of_keywords])
+            self._arguments = arguments
+        return self._arguments
+
+    @classmethod
+    def _make_argument(cls, name, kind, defaults, annotations) -> tuple:
+        kwargs = {}
+        annotation = annotations.get(name)
+        annotation = cls._TYPES_BY_NAME.get(annotation, annotation)
+        default = defaults.get(name, SUPPRESS)
+        if kind == "keyword":
+            args = ("--" + name.replace("_", "-"),)
+            kwargs["dest"] = name
+            if annotation is bool or isinstance(default, bool):
+                kwargs["action"] = _Action.STORE_FALSE if default is True else _Action.STORE_TRUE
+                return name, kind, args, kwargs
+            if default is SUPPRESS:
+                kwargs["required"] = True
+        else:
+            args = (name,)
+            if kind == "var_positional":
+                kwargs["nargs"] = nargs.ZERO_OR_MORE
+            elif default is not SUPPRESS:
+                kwargs["nargs"] = nargs.OPTIONAL
+        if default is not SUPPRESS:
+            kwargs["default"] = default
+        if callable(annotation) and annotation is not bool:
+            kwargs["type"] = annotation
+        elif annotation is None and type(default) in (int, float):
+            kwargs["type"] = type(default)
+        return name, kind, args, kwargs
+
+    def register(self, parser: "_Parser"):
+        """Registers arguments of the function to the parser of its subcommand."""
+        active_groups = _get_session().active_groups
+        active_groups.append(parser)  # so that _get_container returns it without walking frames
+        try:
+            for _, _, args, kwargs in self.get_arguments():
+                parser.add_argument(*args, **kwargs)
+        finally:
+            active_groups.pop()
+
+    def call(self, namespace):
+        """Calls the function with values of namespace."""
+        args, kwargs = [], {}
+        for name, kind, _, _ in self.get_arguments():
+            value = getattr(namespace, name)
+            if kind == "positional":
+                args.append(value)
+            elif kind == "var_positional":
+                args.extend(value)
+            else:
+                kwargs[name] = value
+        return self.func(*args, **kwargs)
+
+
+def _decorate_subcommand(create, func, kwargs):
+    """Makes func the handler of the subcommand made by create(name, **kwargs), and returns func as it is."""
+    name = kwargs.pop("name", None) or func.__name__.replace("_", "-")
+    doc = (func.__doc__ or "").strip()
+    if doc:
+        kwargs.setdefault("help", doc.splitlines()[0])
+        kwargs.setdefault("description", doc)
+    create(name, **kwargs).handler = _Handler(func)
+    return func
+
+
 # noinspection PyUnresolvedReferences,PyShadowingBuiltins
-@functools.singledispatch
-def subcommand(arg):
+def subcommand(arg=None, **kwargs):
+    """
+    Returns subcommand dispatched by the type of arg. See _subcommand_from_name for str.
+    functools.singledispatch is not used since its register() imports typing.
+
+    Decorated function becomes the subcommand of its name, and clappy.dispatch() calls it if invoked.
+    It can be given keyword arguments of the subcommand, including name, by @clappy.subcommand(**kwargs).
+
+    Examples
+    --------
+    >>> # example.py
+    >>> @clappy.subcommand
+    >>> def deploy(target, *, dry_run=False, retries=3):
+    >>>     '''Deploys the target.'''
+    >>>     print(target, dry_run, retries)
+    >>>
+    >>> clappy.dispatch()
+
+    >>> $ python example.py deploy web --retries 5
+    web False 5
+    """
+    if arg is None:
+        return functools.partial(subcommand, **kwargs)
+    if isinstance(arg, types.FunctionType):
+        return _decorate_subcommand(_subcommand_from_name, arg, kwargs)
+    if isinstance(arg, str):
+        return _subcommand_from_name(arg, **kwargs)
     raise NotImplementedError
 
-#
-# @subcommand.register(types.FunctionType)
-# def _(arg: types.FunctionType, **kwargs):
-#     """
-#     Decorated func becomes subcommand.
-#
-#     Examples
-#     --------
-#
-#     >>> # example.py
-#     >>> @clappy.subcommand
-#     >>> def sub(posi, *, kw1, kw2="default"):
-#     >>>     '''help example''' # should use "
-#     >>>     print(posi, kw1, kw2)
-#
-#     >>> $ python example.py sub positional --kw1 first_opt
-#     positional, first_opt, default
-#
-#     >>> $ python above_module.py -h
-#     # make example of help
-#     """
-#
-#     import inspect
-#
-#     func = arg
-#     subcommand = _SubCommand.create(func.__name__, help=func.__doc__, **kwargs)
-#     subcommand.func = func
-#     if not subcommand.invoked:
-#         return subcommand
-#
-#     empty = inspect.Signature.empty
-#     signature = inspect.signature(subcommand)
-#
-#     names = []
-#     has_variable_length_kwargs = False
-#     for name, param in signature.parameters.items():
-#         names.append(name)
-#         if param.kind == param.VAR_KEYWORD:
-#             has_variable_length_kwargs = True
-#             continue
-#         param_flag, default, _type, action, required = name, None, None, None, None
-#         if param.kind == param.KEYWORD_ONLY:
-#             param_flag = f"--{param_flag}"
-#         if param.annotation is not empty:
-#             if param.annotation == bool:
-#                 action = action.STORE_TRUE
-#             else:
-#                 _type = param.annotation
-#         if param.default is not empty:
-#             default = param.default
-#         elif param.kind == param.KEYWORD_ONLY:
-#             required = True
-#         if param.kind == param.VAR_POSITIONAL:
-#             action = action.APPEND
-#         subcommand.add_argument(param_flag, action=action, default=default, type=_type, required=required)
-#     args, unrecognized_args = subcommand.parse_known_args()
-#     if unrecognized_args and len(unrecognized_args) > 1 and has_variable_length_kwargs:
-#         _kwargs = {}
-#         for option_flag, value in zip(unrecognized_args[0::2], unrecognized_args[1::2]):
-#             if not option_flag.startswith(subcommand.prefix):  # prefix check
-#                 raise TypeError(f"Unexpected argument:'{option_flag}' was given.")
-#             _kwargs[option_flag.lstrip(subcommand.prefix)] = value
-#     _args, _kwargs = args  # なんとかしてここつくる boundとか
-#     func(*_args, **_kwargs)
-#     exit()
-
-
-@subcommand.register(str)
-def _(arg: str, *, help=None, **kwargs):
+
+@_auto_construct_parser
+def dispatch():
+    """
+    Calls the function of the invoked subcommand decorated by clappy.subcommand, and returns its result.
+    The subcommand is looked up by the token in args from the table of subcommands by name,
+    so the cost doesn't depend on the number of subcommands. Nested subcommands are followed to the innermost one.
+    Returns None if no decorated subcommand is invoked, or ReturnOnHelp for help.
+    """
+    main_parser = _get_session().parser
+    handlers = [subcommand.handler for subcommand in main_parser._get_invoked_subcommands() if subcommand.handler]
+    if not handlers:
+        return None
+    if main_parser.runs_for_help():
+        main_parser.validate_usage_of_help()
+        return main_parser.return_on_help
+    namespace, _ = main_parser._parse_known_args_sparse()
+    return handlers[-1].call(namespace)
+
+
+# noinspection PyShadowingBuiltins
+def _subcommand_from_name(arg: str, *, help=None, **kwargs):
     """
         Examples
         --------
@@ -2,42 +2,296 @@
 
 from argparse import *
 import argparse
+import itertools
+import os
+import re
 
 from gettext import gettext as _
 
+from . import utils
 
-class ModifiedParser(ArgumentParser):
+TYPE_CHECKING = False  # avoids importing typing at runtime
+if TYPE_CHECKING:
+    from typing import Optional
+
+
+class _ExclusiveGroupContainer:
+    """Mixin creating mutually exclusive groups which register their actions to ConflictTable."""
+
+    def add_mutually_exclusive_group(self, **kwargs):
+        group = ExclusiveGroup(self, **kwargs)
+        self._mutually_exclusive_groups.append(group)
+        return group
+
+
+class ModifiedParser(_ExclusiveGroupContainer, ArgumentParser):
     """
     ArgumentParser focuses on parse_known_args for clappy.
 
     Copyright © 2021 Python Software Foundation; All Rights Reserved
     """
     DEFAULT_OPTION_PREFIX = "-"
+    _registration_count = 0  # changes on registrations to any parser, to find out if the last pass is outdated.
+    _registration_counter = itertools.count(1)  # next() of it is atomic, so racing threads never get same count
+    _last_registered_action = None
+    _last_record: "Optional[_ParseRecord]" = None
+    _dispatch_token: "Optional[str]" = None  # the first arg given to subparsers in the last pass
+    _arg_file_stamps = []  # stamps of files expanded in the last pass
+    # Dict[(path, prefix chars, converter), (stamps of files, args)], shared by all parsers until Session.reset
+    _expanded_files = {}
 
-    def _parse_known_args(self, arg_strings, namespace):
-        """Almost same copy as super()._parse_known_args.
+    @staticmethod
+    def _count_registration(action=None):
+        """Counts a change of any parser. Nested calls for the same action are counted only once."""
+        if action is None or action is not ModifiedParser._last_registered_action:
+            ModifiedParser._registration_count = next(ModifiedParser._registration_counter)
+            ModifiedParser._last_registered_action = action
 
-        This differs by lines 105-107 rows below, 140 rows below and 158 rows below"""
+    @staticmethod
+    def _forget_registration():
+        """Drops the last registered action, so that the class doesn't keep its parser alive."""
+        ModifiedParser._last_registered_action = None
 
-        # replace arg strings that are file references
-        if self.fromfile_prefix_chars is not None:
-            arg_strings = self._read_args_from_files(arg_strings)
+    def __init__(self, *args, **kwargs):
+        self._conflict_table = ConflictTable()
+        self._nargs_regexes = {}  # Dict[(nargs, is optional), compiled pattern of _get_nargs_pattern]
+        self._converted_values = {}  # Dict[(action, arg string), converted value]
+        self._actions_caching_conversion = set()  # actions whose results of type are cached, set by clappy
+        self._locked_actions = set()  # actions taking only the first occurrence in the current pass
+        self._actions_of_dests = {}  # Dict[dest, List[(registration count, action)]] for defaults of TrackedNamespace
+        self._option_trie = OptionTrie()  # shared with groups, which add actions before __init__ of argparse ends
+        super().__init__(*args, **kwargs)
+        self.register("action", "parsers", SubParsersAction)
+
+    def _add_action(self, action):
+        self._count_registration(action)
+        _index_dest(self._actions_of_dests, action)
+        return super()._add_action(action)  # the group adds its option strings to OptionTrie
+
+    def _remove_action(self, action):
+        super()._remove_action(action)
+        _unindex_dest(self._actions_of_dests, action)
+
+    def _get_option_trie(self) -> "Optional[OptionTrie]":
+        """Returns OptionTrie of option strings, or None while a scan of them is faster."""
+        trie = self._option_trie
+        if not trie.is_built:
+            if len(self._option_string_actions) < OptionTrie.MIN_SIZE:
+                return None
+            trie.add_all(self._option_string_actions, builds=True)
+        return trie
+
+    def _get_option_tuples(self, option_string):
+        """
+        Same as argparse, except that options starting with option_string are found by OptionTrie
+        instead of a scan of all option strings. Ambiguous ones are left to argparse for the same error.
+        """
+        chars = self.prefix_chars
+        trie = self._get_option_trie()
+        if trie is None or option_string[0] not in chars:
+            return super()._get_option_tuples(option_string)
+        actions = self._option_string_actions
+        if option_string[1] in chars:
+            if not self.allow_abbrev:
+                return []
+            option_prefix, equals, explicit_arg = option_string.partition("=")
+            count, match = trie.find(option_prefix)
+            if count == 0:
+                return []
+            if count == 1 and match in actions:
+                return [(actions[match], match, explicit_arg if equals else None)]
+        else:
+            count, match = trie.find(option_string)
+            short_option_prefix = option_string[:2]
+            if short_option_prefix in actions:
+                if count == 0:
+                    return [(actions[short_option_prefix], short_option_prefix, option_string[2:])]
+            elif count == 0:
+                return []
+            elif count == 1 and match in actions:
+                return [(actions[match], match, None)]
+        return super()._get_option_tuples(option_string)
+
+    def add_argument_group(self, *args, **kwargs):
+        group = ArgumentGroup(self, *args, **kwargs)
+        self._action_groups.append(group)
+        return group
+
+    def set_defaults(self, **kwargs):
+        self._count_registration()
+        super().set_defaults(**kwargs)
+
+    def parse_known_args(self, args=None, namespace=None):
+        """Same as argparse. Values of all the dests are in the namespace, unlike the sparse one of passes."""
+        namespace, extras = self._parse_known_args_sparse(args, namespace)
+        if isinstance(namespace, TrackedNamespace):
+            namespace = namespace.to_namespace()
+        return namespace, extras
+
+    def _parse_known_args_sparse(self, args=None, namespace=None):
+        """Returns TrackedNamespace of a pass and extras, if namespace is not given."""
+        if namespace is None:
+            namespace = TrackedNamespace([(self._actions_of_dests, self._defaults, ModifiedParser._registration_count)])
+        self._dispatch_token = None
+        try:
+            if not utils.stats.enabled:
+                return super().parse_known_args(args, namespace)
+            with utils.stats.measure("full_pass", self.prog):
+                return super().parse_known_args(args, namespace)
+        finally:
+            self._locked_actions.clear()
+
+    def parse_known_args_incrementally(self, args):
+        """
+        Same as parse_known_args(args), but reuses the result of the last pass over the same args.
+
+        If nothing is registered since the last pass, its result is returned as it is.
+        If only one optional is registered to this parser since then, only the tokens of the optional are consumed
+        on the namespace of the last pass. Otherwise, all args are parsed again.
+        """
+        record = self._last_record
+        if (record is not None and record.source is args and record.source_length == len(args)
+                and _are_stamps_current(record.arg_file_stamps)):
+            if record.registration_count == ModifiedParser._registration_count:
+                if utils.stats.enabled:
+                    utils.stats.count("reused_pass")
+                return record.namespace, list(record.extra_strings)
+            if (record.registration_count + 1 == ModifiedParser._registration_count
+                    and record.action_count + 1 == len(self._actions)):
+                result = self._consume_new_action(record, self._actions[-1])
+                if result is not None:
+                    if utils.stats.enabled:
+                        utils.stats.count("incremental_pass")
+                    return result
+
+        namespace, extras = self._parse_known_args_sparse(args)
+        record = self._last_record
+        if record is not None and record.namespace is namespace:
+            record.source = args
+            record.source_length = len(args)
+            record.registration_count = ModifiedParser._registration_count
+            record.extra_strings = list(extras)
+        return namespace, extras
+
+    def _consume_new_action(self, record, action):
+        """Consumes only the tokens of newly registered optional on the namespace of the last pass.
+
+        Returns None if the optional can change how other tokens are interpreted.
+        In that case, all args need to be parsed again."""
+        if (not action.option_strings or action.nargs in (PARSER, REMAINDER)
+                or record.has_positionals or action in self._conflict_table.bits
+                or not isinstance(record.namespace, TrackedNamespace)):
+            return None
+        namespace = record.namespace
+        if action.dest is not SUPPRESS and (action.dest in vars(namespace) or action.dest in self._defaults
+                                            or len(self._actions_of_dests[action.dest]) > 1):
+            return None  # the order with other actions sharing the dest matters.
+        for option_string in action.option_strings:
+            if len(option_string) < 2 or " " in option_string or self._negative_number_matcher.match(option_string):
+                return None
+
+        # tokens which were jointed short options like -xyz may include the new option
+        prefix_chars = self.prefix_chars
+        option_string_indices = record.option_string_indices
+        for index in record.jointed_indices:
+            option_string, explicit_arg = option_string_indices[index][1:]
+            for char in explicit_arg:
+                if option_string[0] + char in action.option_strings:
+                    return None
+
+        # only tokens starting with a prefix of new option strings can be interpreted differently
+        arg_strings = record.arg_strings
+        candidates = set()
+        for option_string in action.option_strings:
+            for end in range(1, len(option_string) + 1):
+                candidates.update(record.prefixed_indices.get(option_string[:end], ()))
+        new_tuples = {}
+        for index in candidates:
+            option_tuple = self._parse_optional(arg_strings[index])
+            last_tuple = option_string_indices.get(index)
+            if option_tuple == last_tuple:
+                continue
+            if option_tuple is None or option_tuple[0] is not action or last_tuple is None or last_tuple[0] is not None:
+                return None
+            new_tuples[index] = option_tuple
+
+        # decide the tokens to be consumed before touching the namespace
+        extras = record.extras
+        arg_strings_pattern = record.arg_strings_pattern
+        planned = []
+        for index in sorted(new_tuples):
+            option_string, explicit_arg = new_tuples[index][1:]
+            try:
+                if explicit_arg is not None:
+                    if self._match_argument(action, 'A') != 1:
+                        return None
+                    stop = index + 1
+                    args = [explicit_arg]
+                else:
+                    arg_count = self._match_argument(action, arg_strings_pattern[index + 1:])
+                    stop = index + 1 + arg_count
+                    args = arg_strings[index + 1:stop]
+            except ArgumentError:
+                return None
+            if not all(i in extras for i in range(index, stop)):
+                return None
+            planned.append((index, stop, args, option_string, explicit_arg))
 
-        # map all mutually exclusive arguments to the other arguments
-        # they can't occur with
-        action_conflicts = {}
-        for mutex_group in self._mutually_exclusive_groups:
-            group_actions = mutex_group._group_actions
-            for i, mutex_action in enumerate(mutex_group._group_actions):
-                conflicts = action_conflicts.setdefault(mutex_action, [])
-                conflicts.extend(group_actions[:i])
-                conflicts.extend(group_actions[i + 1:])
-
-        # find all option indices, and determine the arg_string_pattern
-        # which has an 'O' if there is an option at an index,
-        # an 'A' if there is an argument, or a '-' if there is a '--'
+        self._last_record = None
+        namespace.resolve_registered()  # instead of writing the default of action
+        seen_actions = set()
+
+        def take_action(_action, argument_strings, _option_string=None):
+            seen_actions.add(_action)
+            argument_values = self._get_values(_action, argument_strings)
+            if argument_values is not SUPPRESS:
+                _action(self, namespace, argument_values, _option_string)
+
+        try:
+            namespace.tracking = True
+            set_of_arg_strings = set(arg_strings)
+            for index, stop, args, option_string, explicit_arg in planned:
+                self._run_if_not_parsed(namespace, take_action, explicit_arg, set_of_arg_strings,
+                                        [(action, args, option_string)])
+                for i in range(index, stop):
+                    del extras[i]
+            namespace.tracking = False
+            if action not in seen_actions:
+                if action.required:
+                    self.error(_('the following arguments are required: %s') % self._get_action_name(action))
+                if (isinstance(action.default, str) and hasattr(namespace, action.dest)
+                        and action.default is getattr(namespace, action.dest)):
+                    setattr(namespace, action.dest, self._get_value(action, action.default))
+        except ArgumentError as err:
+            if getattr(self, "exit_on_error", True):
+                self.error(str(err))
+            raise
+        finally:
+            namespace.tracking = False
+            self._locked_actions.discard(action)
+
+        option_string_indices.update(new_tuples)
+        for index, option_tuple in new_tuples.items():
+            option_string, explicit_arg = option_tuple[1:]
+            if explicit_arg is not None and option_string[1:2] not in prefix_chars:
+                record.jointed_indices.append(index)
+        record.registration_count = ModifiedParser._registration_count
+        record.action_count = len(self._actions)
+        record.extra_strings = [arg_strings[index] for index in extras]
+        self._last_record = record
+        return namespace, list(record.extra_strings)
+
+    def _index_arg_strings(self, arg_strings):
+        """Returns indices of options, the pattern of args and indices of tokens starting with prefix chars.
+
+        The pattern has an 'O' if there is an option at an index,
+        an 'A' if there is an argument, or a '-' if there is a '--'.
+        Tokens starting with prefix chars are indexed by the part before '=',
+        and also by the first 2 characters for single-dash tokens like -kval."""
         option_string_indices = {}
         arg_string_pattern_parts = []
+        prefixed_indices = {}
+        prefix_chars = self.prefix_chars
         arg_strings_iter = iter(arg_strings)
         for i, arg_string in enumerate(arg_strings_iter):
 
@@ -58,14 +312,45 @@ class ModifiedParser(ArgumentParser):
                     pattern = 'O'
                 arg_string_pattern_parts.append(pattern)
 
+                if arg_string and arg_string[0] in prefix_chars:
+                    head = arg_string.split('=', 1)[0]
+                    prefixed_indices.setdefault(head, []).append(i)
+                    if len(arg_string) > 2 and arg_string[1] not in prefix_chars and head[:2] != head:
+                        prefixed_indices.setdefault(arg_string[:2], []).append(i)
+
         # join the pieces together to form the pattern
-        arg_strings_pattern = ''.join(arg_string_pattern_parts)
+        return option_string_indices, ''.join(arg_string_pattern_parts), prefixed_indices
+
+    def _parse_known_args(self, arg_strings, namespace):
+        """Almost same copy as super()._parse_known_args.
+
+        This differs by lines 105-107 rows below, 140 rows below and 158 rows below.
+        Additionally, the result is kept as _last_record for parse_known_args_incrementally."""
+
+        # replace arg strings that are file references
+        if self.fromfile_prefix_chars is not None:
+            arg_strings = self._read_args_from_files(arg_strings)
+
+        # mutually exclusive arguments are mapped to the other arguments they can't occur with
+        # by _conflict_table on registration, instead of on each pass (modified from argparse)
+        conflict_table = self._conflict_table
+        bits_of_actions = conflict_table.bits
+        conflicts_of_actions = conflict_table.conflicts
+        seen_non_default_bits = 0
+
+        option_string_indices, arg_strings_pattern, prefixed_indices = self._index_arg_strings(arg_strings)
+
+        # record dests written by actions, but not by the conversion of defaults at the end
+        tracks_writes = isinstance(namespace, TrackedNamespace)
+        if tracks_writes:
+            namespace.tracking = True
 
         # converts arg strings to the appropriate and then takes the action
         seen_actions = set()
         seen_non_default_actions = set()
 
         def take_action(action, argument_strings, option_string=None):
+            nonlocal seen_non_default_bits
             seen_actions.add(action)
             argument_values = self._get_values(action, argument_strings)
 
@@ -74,8 +359,11 @@ class ModifiedParser(ArgumentParser):
             # value don't really count as "present"
             if argument_values is not action.default:
                 seen_non_default_actions.add(action)
-                for conflict_action in action_conflicts.get(action, []):
-                    if conflict_action in seen_non_default_actions:
+                if action in bits_of_actions:
+                    seen_non_default_bits |= bits_of_actions[action]
+                    if conflicts_of_actions[action] & seen_non_default_bits:
+                        conflict_action = conflict_table.get_first_conflict(
+                            action, seen_non_default_actions, self._mutually_exclusive_groups)
                         msg = _('not allowed with argument %s')
                         action_name = self._get_action_name(conflict_action)
                         raise ArgumentError(action, msg % action_name)
@@ -100,7 +388,7 @@ class ModifiedParser(ArgumentParser):
 
                 # if we found no optional action, skip it
                 if action is None:
-                    extras.append(arg_strings[start_index])
+                    extras.append(start_index)
                     return start_index + 1
 
                 # if there is an explicit argument, try to match the
@@ -147,8 +435,7 @@ class ModifiedParser(ArgumentParser):
                 # if successful, exit the loop
                 else:
                     start = start_index + 1
-                    selected_patterns = arg_strings_pattern[start:]
-                    arg_count = match_argument(action, selected_patterns)
+                    arg_count = self._match_argument_at(action, arg_strings_pattern, start)  # modified from argparse
                     stop = start + arg_count
                     args = arg_strings[start:stop]
                     action_tuples.append((action, args, option_string))
@@ -157,7 +444,7 @@ class ModifiedParser(ArgumentParser):
             # add the Optional to the list and return the index at which
             # the Option's string args stopped
             assert action_tuples
-            self._run_if_not_parsed(namespace, take_action, explicit_arg, arg_strings, action_tuples)
+            self._run_if_not_parsed(namespace, take_action, explicit_arg, set_of_arg_strings, action_tuples)
             return stop
 
         # the list of Positionals left to be parsed; this is modified
@@ -167,9 +454,9 @@ class ModifiedParser(ArgumentParser):
         # function to convert arg_strings into positional actions
         def consume_positionals(start_index):
             # match as many Positionals as possible
-            match_partial = self._match_arguments_partial
-            selected_pattern = arg_strings_pattern[start_index:]
-            arg_counts = match_partial(positionals, selected_pattern)
+            if not positionals:  # modified from argparse
+                return start_index
+            arg_counts = self._match_arguments_partial_at(positionals, arg_strings_pattern, start_index)
 
             # slice off the appropriate arg strings for each Positional
             # and add the Positional and its args to the list
@@ -187,17 +474,20 @@ class ModifiedParser(ArgumentParser):
         # passed the last option string
         extras = []
         start_index = 0
+        set_of_arg_strings = set(arg_strings)
+        # indices of options are ascending, so the next option is found by a cursor (modified from argparse)
+        sorted_option_string_indices = list(option_string_indices)
+        cursor = 0
         if option_string_indices:
-            max_option_string_index = max(option_string_indices)
+            max_option_string_index = sorted_option_string_indices[-1]
         else:
             max_option_string_index = -1
         while start_index <= max_option_string_index:
 
             # consume any Positionals preceding the next option
-            next_option_string_index = min([
-                index
-                for index in option_string_indices
-                if index >= start_index])
+            while sorted_option_string_indices[cursor] < start_index:
+                cursor += 1
+            next_option_string_index = sorted_option_string_indices[cursor]
             if start_index != next_option_string_index:
                 positionals_end_index = consume_positionals(start_index)
 
@@ -212,8 +502,7 @@ class ModifiedParser(ArgumentParser):
             # if we consumed all the positionals we could and we're not
             # at the index of an option string, there were extra arguments
             if start_index not in option_string_indices:
-                strings = arg_strings[start_index:next_option_string_index]
-                extras.extend(strings)
+                extras.extend(range(start_index, next_option_string_index))
                 start_index = next_option_string_index
 
             # consume the next optional and any arguments for it
@@ -223,7 +512,10 @@ class ModifiedParser(ArgumentParser):
         stop_index = consume_positionals(start_index)
 
         # if we didn't consume all the argument strings, there were extras
-        extras.extend(arg_strings[stop_index:])
+        extras.extend(range(stop_index, len(arg_strings)))
+
+        if tracks_writes:
+            namespace.tracking = False
 
         # make sure all required actions were present and also convert
         # action defaults which were not given as arguments
@@ -265,8 +557,97 @@ class ModifiedParser(ArgumentParser):
                     msg = _('one of the arguments %s is required')
                     self.error(msg % ' '.join(names))
 
+        # keep the result so that following registrations can consume only their own tokens
+        self._last_record = _ParseRecord(arg_strings, option_string_indices, arg_strings_pattern,
+                                         prefixed_indices, extras, namespace, len(self._actions),
+                                         any(not action.option_strings for action in self._actions))
+        if self.fromfile_prefix_chars is not None:
+            self._last_record.arg_file_stamps = self._arg_file_stamps
+        prefix_chars = self.prefix_chars
+        for index, (action, option_string, explicit_arg) in option_string_indices.items():
+            if action is not None and explicit_arg is not None and option_string[1:2] not in prefix_chars:
+                self._last_record.jointed_indices.append(index)
+
         # return the updated namespace and the extra arguments
-        return namespace, extras
+        return namespace, [arg_strings[index] for index in extras]
+
+    def _read_args_from_files(self, arg_strings):
+        """
+        Same as super()._read_args_from_files, but expanded files are cached by _read_args_from_file.
+        Stamps of the files are kept as _arg_file_stamps, so that the result of the pass can be validated.
+        """
+        new_arg_strings = []
+        stamps = self._arg_file_stamps = []
+        fromfile_prefix_chars = self.fromfile_prefix_chars
+        for arg_string in arg_strings:
+            if not arg_string or arg_string[0] not in fromfile_prefix_chars:
+                new_arg_strings.append(arg_string)
+            else:
+                try:
+                    referenced_stamps, referenced_arg_strings = self._read_args_from_file(arg_string[1:])
+                except OSError as err:
+                    self.error(str(err))
+                stamps.extend(referenced_stamps)
+                new_arg_strings.extend(referenced_arg_strings)
+        return new_arg_strings
+
+    def _read_args_from_file(self, path):
+        """
+        Returns stamps of the file and files referenced from it recursively, and args expanded from them.
+
+        The result is cached for all parsers while size and mtime of all the files are same,
+        so that re-parses don't read the files again. The file is read at once instead of line by line.
+        """
+        convert = getattr(self.convert_arg_line_to_args, "__func__", self.convert_arg_line_to_args)
+        key = os.path.abspath(path), self.fromfile_prefix_chars, convert
+        cached = self._expanded_files.get(key)
+        if cached is not None and _are_stamps_current(cached[0]):
+            if utils.stats.enabled:
+                utils.stats.count("arg_file_cache_hit", path)
+            return cached
+
+        with open(path) as args_file:
+            stamps = [(key[0], _get_stamp(args_file.fileno()))]
+            lines = args_file.read().splitlines()
+        if utils.stats.enabled:
+            utils.stats.count("arg_file_read", path)
+        if convert is ArgumentParser.convert_arg_line_to_args:
+            arg_strings = lines
+        else:
+            arg_strings = [arg for arg_line in lines for arg in self.convert_arg_line_to_args(arg_line)]
+
+        new_arg_strings = []
+        for arg_string in arg_strings:
+            if not arg_string or arg_string[0] not in self.fromfile_prefix_chars:
+                new_arg_strings.append(arg_string)
+            else:
+                referenced_stamps, referenced_arg_strings = self._read_args_from_file(arg_string[1:])
+                stamps.extend(referenced_stamps)
+                new_arg_strings.extend(referenced_arg_strings)
+        cached = self._expanded_files[key] = stamps, new_arg_strings
+        return cached
+
+    def _match_argument_at(self, action, arg_strings_pattern, start):
+        """Same as _match_argument(action, arg_strings_pattern[start:]), but without slicing the pattern."""
+        key = action.nargs, bool(action.option_strings)
+        nargs_regex = self._nargs_regexes.get(key)
+        if nargs_regex is None:
+            nargs_regex = self._nargs_regexes[key] = re.compile(self._get_nargs_pattern(action))
+        match = nargs_regex.match(arg_strings_pattern, start)
+        if match is None:
+            return self._match_argument(action, arg_strings_pattern[start:])  # raises the error
+        return len(match.group(1))
+
+    def _match_arguments_partial_at(self, actions, arg_strings_pattern, start):
+        """Same as _match_arguments_partial(actions, arg_strings_pattern[start:]), but without slicing the pattern."""
+        result = []
+        for i in range(len(actions), 0, -1):
+            pattern = ''.join([self._get_nargs_pattern(action) for action in actions[:i]])
+            match = re.compile(pattern).match(arg_strings_pattern, start)
+            if match is not None:
+                result.extend([len(string) for string in match.groups()])
+                break
+        return result
 
     @classmethod
     def _check_if_jointed_short_option(cls, action, option_string):
@@ -278,10 +659,11 @@ class ModifiedParser(ArgumentParser):
             return False
 
     def _run_if_not_parsed(self, namespace, take_action, explicit_arg, arg_strings, action_tuples):
+        """arg_strings can be a set of them, since only membership is checked."""
         for action, args, option_string in action_tuples:
             if isinstance(action, argparse._HelpAction):
                 continue
-            if hasattr(action, "parsed_currently") and action.parsed_currently is True:
+            if action in self._locked_actions:
                 continue
             take_action(action, args, option_string)
             option_name = option_string.lstrip("-")
@@ -291,11 +673,33 @@ class ModifiedParser(ArgumentParser):
                     append_class = registered_actions["append"]
                     extend_class = registered_actions.get("extend", type(None))  # extend class exists from Python3.8
                     if not isinstance(action, (append_class, extend_class)):
-                        action.parsed_currently = True
+                        self._locked_actions.add(action)
+
+    def _get_value(self, action, arg_string):
+        """
+        Same as super()._get_value, but the result is cached for the action and arg_string
+        if the action has a type and is in _actions_caching_conversion, which is set by clappy.
+        """
+        if action.type is None or action not in self._actions_caching_conversion:
+            return self._convert_value(action, arg_string)
+        key = action, arg_string
+        converted_values = self._converted_values
+        if key in converted_values:
+            if utils.stats.enabled:
+                utils.stats.count("type_conversion_cache_hit", self._get_action_name(action) or action.dest)
+            return converted_values[key]
+        value = converted_values[key] = self._convert_value(action, arg_string)
+        return value
+
+    def _convert_value(self, action, arg_string):
+        if not utils.stats.enabled:
+            return super()._get_value(action, arg_string)
+        with utils.stats.measure("type_conversion", self._get_action_name(action) or action.dest):
+            return super()._get_value(action, arg_string)
 
     def _get_values(self, action, arg_strings):
         """Almost same as super()._get_values.
-        This differs only at line 41 rows below that runs '_check_if_subcommand_included'."""
+        This differs only at lines 41-42 rows below that keep _dispatch_token and run '_check_if_subcommand_included'."""
         # for everything but PARSER, REMAINDER args, strip out first '--'
         if action.nargs not in [PARSER, REMAINDER]:
             try:
@@ -336,6 +740,7 @@ class ModifiedParser(ArgumentParser):
         # PARSER arguments convert all values, but check only the first
         elif action.nargs == PARSER:
             value = [self._get_value(action, v) for v in arg_strings]
+            self._dispatch_token = value[0]  # modified from argparse
             self._check_if_subcommand_included(action, value)  # modified from argparse
 
         # all other types of nargs produce a list
@@ -366,8 +771,351 @@ class ModifiedParser(ArgumentParser):
             msg = f"Failed to find subcommand {action_names} in args: {given_args}"
         else:
             msg = f"Valid value for {str(action)} is not found in value: {given_args}"
-        raise self.SubCommandNotFound(msg)
+        raise self.SubCommandNotFound(msg, self)
 
     class SubCommandNotFound(Exception):
-        def __init__(self, message):
+        def __init__(self, message, parser=None):
             self.message = message
+            self.parser = parser  # whose subcommand is not found
+
+
+class TrackedNamespace(Namespace):
+    """
+    Namespace recording the dests written while tracking, and the version of the last write for each.
+
+    Versions increase across all instances, so that the order of writes can be compared between namespaces.
+    Writes of defaults are not tracked by ModifiedParser, so written has only the dests which args changed.
+
+    It's sparse. Only written values are stored, and defaults are resolved from actions of parsers on read,
+    so that a pass doesn't write a default for each of thousands of dests.
+    Actions registered after the pass are not resolved, same as argparse never wrote them.
+    """
+    __slots__ = ("tracking", "written", "_resolvers")
+    version = 0
+
+    def __init__(self, resolvers=(), **kwargs):
+        object.__setattr__(self, "tracking", False)
+        object.__setattr__(self, "written", {})
+        # List[(actions of dests, defaults of parser, registration count)], where parsers of subcommands come first
+        object.__setattr__(self, "_resolvers", list(resolvers))
+        super().__init__(**kwargs)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if self.tracking and name not in self.__slots__:
+            TrackedNamespace.version += 1
+            self.written[name] = TrackedNamespace.version
+
+    def __getattr__(self, name):
+        """Returns the default of dest not written, same as the one argparse writes before a pass."""
+        try:
+            resolvers = object.__getattribute__(self, "_resolvers")
+        except AttributeError:  # not initialized, e.g. on copy
+            raise AttributeError(name) from None
+        for actions_of_dests, parser_defaults, registration_count in resolvers:
+            for count, action in actions_of_dests.get(name, ()):
+                if count <= registration_count and action.default is not SUPPRESS:
+                    return action.default
+            if name in parser_defaults:
+                return parser_defaults[name]
+        raise AttributeError(name)
+
+    def __contains__(self, key):
+        return hasattr(self, key)
+
+    def __eq__(self, other):
+        if not isinstance(other, Namespace):
+            return NotImplemented
+        return dict(self._get_kwargs()) == dict(other._get_kwargs())
+
+    __hash__ = None
+
+    def _get_kwargs(self):
+        names = {name for actions_of_dests, parser_defaults, _ in self._resolvers
+                 for name in (*actions_of_dests, *parser_defaults)}
+        names.update(self.__dict__)
+        return sorted((name, getattr(self, name)) for name in names if hasattr(self, name))
+
+    def to_namespace(self) -> Namespace:
+        """Returns Namespace with values of all the dests, same as argparse returns."""
+        return Namespace(**dict(self._get_kwargs()))
+
+    def update_by_subparser(self, subnamespace: "TrackedNamespace"):
+        """Takes values of the namespace of a subparser, same as argparse copies all of them including defaults."""
+        written = vars(subnamespace)
+        for name, value in written.items():
+            setattr(self, name, value)
+        resolvers = subnamespace._resolvers
+        object.__setattr__(self, "_resolvers", resolvers + self._resolvers)
+        for name in list(vars(self)):  # defaults of the subparser override values written by this parser
+            if name not in written:
+                if hasattr(subnamespace, name):
+                    setattr(self, name, getattr(subnamespace, name))
+
+    def resolve_registered(self):
+        """Resolves defaults of actions registered so far, after a pass took the new ones incrementally."""
+        *resolvers, (actions_of_dests, parser_defaults, _) = self._resolvers
+        resolvers.append((actions_of_dests, parser_defaults, ModifiedParser._registration_count))
+        object.__setattr__(self, "_resolvers", resolvers)
+
+
+class SubParsersAction(argparse._SubParsersAction):
+    """Subparsers action taking defaults of the subparser into TrackedNamespace, which doesn't store them."""
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        subparser = self._name_parser_map.get(values[0])
+        if subparser is None:
+            return super().__call__(parser, namespace, values, option_string)  # raises the error of argparse
+        # same as argparse, except that vars() of the sparse namespace of subparser doesn't have its defaults
+        if self.dest is not SUPPRESS:
+            setattr(namespace, self.dest, values[0])
+        if isinstance(namespace, TrackedNamespace) and isinstance(subparser, ModifiedParser):
+            subnamespace, arg_strings = subparser._parse_known_args_sparse(values[1:])
+            namespace.update_by_subparser(subnamespace)
+        else:
+            subnamespace, arg_strings = subparser.parse_known_args(values[1:], Namespace())
+            for key, value in vars(subnamespace).items():
+                setattr(namespace, key, value)
+        if arg_strings:
+            vars(namespace).setdefault(argparse._UNRECOGNIZED_ARGS_ATTR, [])
+            getattr(namespace, argparse._UNRECOGNIZED_ARGS_ATTR).extend(arg_strings)
+
+
+def _index_dest(actions_of_dests, action):
+    if action.dest is not SUPPRESS:
+        actions = actions_of_dests.setdefault(action.dest, [])
+        if not actions or actions[-1][1] is not action:  # the parser adds it by the group too
+            actions.append((ModifiedParser._registration_count, action))
+
+
+def _unindex_dest(actions_of_dests, action):
+    actions = actions_of_dests.get(action.dest)
+    if actions is not None:
+        actions[:] = [item for item in actions if item[1] is not action]
+        if not actions:
+            del actions_of_dests[action.dest]
+
+
+def _get_stamp(path_or_fd):
+    """Returns size and mtime of the file, or None if it can't be accessed."""
+    try:
+        stat = os.stat(path_or_fd)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _are_stamps_current(stamps):
+    return all(_get_stamp(path) == stamp for path, stamp in stamps)
+
+
+# noinspection PyProtectedMember
+class ArgumentGroup(_ExclusiveGroupContainer, argparse._ArgumentGroup):
+    """Argument group counting registrations, and sharing ConflictTable with the parser."""
+
+    def __init__(self, container, *args, **kwargs):
+        super().__init__(container, *args, **kwargs)
+        self._conflict_table: ConflictTable = container._conflict_table
+        self._actions_of_dests = container._actions_of_dests
+        self._option_trie: OptionTrie = container._option_trie
+
+    def _add_action(self, action):
+        ModifiedParser._count_registration(action)
+        _index_dest(self._actions_of_dests, action)
+        action = super()._add_action(action)
+        self._option_trie.add_all(action.option_strings)
+        return action
+
+    def _remove_action(self, action):
+        super()._remove_action(action)
+        _unindex_dest(self._actions_of_dests, action)
+
+
+# noinspection PyProtectedMember
+class ExclusiveGroup(_ExclusiveGroupContainer, argparse._MutuallyExclusiveGroup):
+    """Mutually exclusive group registering its actions to ConflictTable of the parser."""
+
+    def __init__(self, container, required=False):
+        super().__init__(container, required)
+        self._conflict_table: ConflictTable = container._conflict_table
+
+    def _add_action(self, action):
+        action = super()._add_action(action)
+        self._conflict_table.add(self, action)
+        return action
+
+
+class ConflictTable:
+    """
+    Actions in mutually exclusive groups, mapped to the other actions they can't occur with.
+
+    Each action has a bit, and its conflicts are kept as the bitset of them updated on registration,
+    so that a pass of parse checks conflicts by an operation of int against the bitset of seen actions.
+    """
+
+    def __init__(self):
+        self.bits = {}  # Dict[action, bit of action]
+        self.conflicts = {}  # Dict[action, bitset of conflicting actions]
+
+    def add(self, group: ExclusiveGroup, action):
+        """Adds action appended to group."""
+        bits = self.bits
+        if action not in bits:
+            bits[action] = 1 << len(bits)
+            self.conflicts[action] = 0
+        bit = bits[action]
+        # noinspection PyProtectedMember
+        for member in group._group_actions:
+            if member is not action:
+                self.conflicts[action] |= bits[member]
+                self.conflicts[member] |= bit
+
+    @staticmethod
+    def get_first_conflict(action, seen_actions, groups):
+        """Returns the seen action conflicting with action, in the same order as argparse finds."""
+        for group in groups:
+            # noinspection PyProtectedMember
+            group_actions = group._group_actions
+            if action in group_actions:
+                for member in group_actions:
+                    if member is not action and member in seen_actions:
+                        return member
+        return None
+
+
+class OptionTrie:
+    """
+    Radix tree of option strings, so that the ones starting with a prefix are found in O(length of the prefix)
+    instead of a scan of all option strings like argparse.
+
+    It's built on the first lookup after MIN_SIZE option strings are registered, since exact option strings are
+    found by dict, and a scan of fewer ones is faster. Then it's updated on registration.
+    Option strings dropped by conflict_handler="resolve" may remain, so found ones are checked by the parser.
+    """
+    __slots__ = ("_root",)
+    MIN_SIZE = 64
+
+    class _Node:
+        __slots__ = ("label", "children", "count", "option_string")
+
+        def __init__(self, label, children=None, count=0, option_string=None):
+            self.label = label  # chars from the parent to the node
+            self.children = children  # Dict[first char of label, child] or None for a leaf
+            self.count = count  # of option strings in the subtree
+            self.option_string = option_string  # ending at the node
+
+    def __init__(self):
+        self._root = None
+
+    @property
+    def is_built(self) -> bool:
+        return self._root is not None
+
+    def add_all(self, option_strings, builds=False):
+        """Adds option strings if the trie is built or builds is True."""
+        if builds and self._root is None:
+            self._root = self._Node("", {})
+        if self._root is not None:
+            for option_string in option_strings:
+                self._add(option_string)
+
+    def _add(self, option_string):
+        node = self._root
+        passed = []  # nodes whose count is incremented if option_string is new
+        index = 0
+        while index < len(option_string):
+            passed.append(node)
+            if node.children is None:
+                node.children = {}
+            char = option_string[index]
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = self._Node(option_string[index:])
+                node = child
+                break
+            label = child.label
+            if option_string.startswith(label, index):
+                common = len(label)
+            else:
+                common = 1
+                while index + common < len(option_string) and label[common] == option_string[index + common]:
+                    common += 1
+            if common < len(label):  # splits the label
+                child.label = label[common:]
+                child = node.children[char] = self._Node(label[:common], {label[common]: child}, child.count)
+            node = child
+            index += common
+        if node.option_string is not None:
+            return  # added already, e.g. by conflict_handler="resolve"
+        node.option_string = option_string
+        passed.append(node)
+        for node in passed:
+            node.count += 1
+
+    def _descend(self, prefix, passed=None) -> tuple:
+        """
+        Returns the node whose subtree has the option strings starting with prefix, or None.
+        Option strings which are proper prefixes of prefix are appended to passed.
+        """
+        node = self._root
+        if node is None:
+            return None, passed
+        index = 0
+        while index < len(prefix):
+            if passed is not None and node.option_string is not None:
+                passed.append(node.option_string)
+            child = node.children.get(prefix[index]) if node.children else None
+            if child is None or not child.label.startswith(prefix[index:index + len(child.label)]):
+                return None, passed
+            index += len(child.label)
+            node = child
+        return node, passed
+
+    def find(self, prefix) -> tuple:
+        """Returns the count of option strings starting with prefix, and the option string if it's the only one."""
+        node, _ = self._descend(prefix)
+        if node is None:
+            return 0, None
+        if node.count != 1:
+            return node.count, None
+        while node.option_string is None:
+            node = next(iter(node.children.values()))
+        return 1, node.option_string
+
+    def get_related(self, option_string) -> list:
+        """Returns option strings which are proper prefixes of option_string or start with it."""
+        node, related = self._descend(option_string, [])
+        stack = [] if node is None else [node]
+        while stack:
+            node = stack.pop()
+            if node.option_string is not None and node.option_string != option_string:
+                related.append(node.option_string)
+            if node.children:
+                stack.extend(node.children.values())
+        return related
+
+
+class _ParseRecord:
+    """Result of a pass of ModifiedParser._parse_known_args, kept for following registrations."""
+    __slots__ = ("arg_strings", "option_string_indices", "arg_strings_pattern", "prefixed_indices", "extras",
+                 "jointed_indices", "arg_file_stamps", "namespace", "action_count", "has_positionals", "source",
+                 "source_length", "registration_count", "extra_strings")
+
+    def __init__(self, arg_strings, option_string_indices, arg_strings_pattern, prefixed_indices, extras,
+                 namespace, action_count, has_positionals):
+        self.arg_strings = arg_strings
+        self.option_string_indices = option_string_indices
+        self.arg_strings_pattern = arg_strings_pattern
+        self.prefixed_indices = prefixed_indices
+        self.extras = dict.fromkeys(extras)  # ordered set of indices
+        self.jointed_indices = []
+        self.arg_file_stamps = []  # the result is outdated if any of files expanded into args changed
+        self.namespace = namespace
+        self.action_count = action_count
+        self.has_positionals = has_positionals
+
+        # set by ModifiedParser.parse_known_args_incrementally
+        self.source = None
+        self.source_length = 0
+        self.registration_count = -1
+        self.extra_strings = []
@@ -1,63 +1,263 @@
-import inspect
-import functools
-import pathlib
+import os
+import re
+import sys
 
-import __main__
+_NAME_OF_PACKAGE = __name__.partition(".")[0]
 
 
-def get_caller_name(name_change_count: int = 2):
+def _get_stem(filename: str) -> str:
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+if hasattr(sys.modules["__main__"], "__file__"):
+    filename_of_main = _get_stem(sys.modules["__main__"].__file__)
+else:  # In Jupyter Notebook, __main__ module has no attribute of __file__
+    filename_of_main = "__main__"
+
+
+class CallerModule:
+    """name is __name__ of the module, and stem is the name of its file without suffix."""
+    __slots__ = ("name", "stem")
+
+    def __init__(self, name: str, stem: str):
+        self.name = name
+        self.stem = stem
+
+    @property
+    def is_main(self):
+        """Compares __name__ instead of stem, so that same-stem modules in packages are not regarded as main."""
+        return self.name == "__main__" or self.name == filename_of_main
+
+
+def get_path_of_frozen(main_file: str) -> str:
+    """Returns the path of the frozen parser generated by python -m clappy.freeze for the script."""
+    return os.path.splitext(main_file)[0] + "_clappy_frozen.py"
+
+
+_caller_modules = {}  # Dict[code object of caller, CallerModule]
+
+
+def get_caller_module():
+    """
+    Returns CallerModule of the first module outside clappy in the stack.
+    The result is cached per code object of the caller, so that repeated calls from same place cost O(1).
+    """
+    if stats.enabled:
+        stats.count("frame_walk")
+    frame = sys._getframe(1)
+    while frame.f_back is not None and _is_module_of_clappy(frame.f_globals.get("__name__", "")):
+        frame = frame.f_back
+    code = frame.f_code
+    caller_module = _caller_modules.get(code)
+    if caller_module is None:
+        stem = _get_stem(code.co_filename)
+        caller_module = _caller_modules[code] = CallerModule(frame.f_globals.get("__name__", stem), stem)
+    return caller_module
+
+
+def clear_caches():
+    """Clears caches shared by sessions, which hold code objects of callers. They are filled again on demand."""
+    _caller_modules.clear()
+
+
+def _is_module_of_clappy(name: str):
+    return name == _NAME_OF_PACKAGE or name.startswith(_NAME_OF_PACKAGE + ".")
+
+
+def freeze(value):
+    """
+    Returns hashable equivalent of value, so that arguments including lists or dicts can be a key of dict.
+    Unhashable objects of other types are identified by id().
+    """
+    if isinstance(value, dict):
+        return dict, tuple((key, freeze(val)) for key, val in value.items())
+    elif isinstance(value, (list, tuple)):
+        return type(value), tuple(freeze(val) for val in value)
+    elif isinstance(value, (set, frozenset)):
+        return type(value), frozenset(freeze(val) for val in value)
+    try:
+        hash(value)
+    except TypeError:
+        return type(value), id(value)
+    return value
+
+
+_QUOTES_AND_ESCAPE = ("'", '"', "\\")
+_SHELL_WHITESPACES = re.compile("[ \t\r\n]+")
+_SHELL_PIECE = re.compile(r"""
+    (?P<plain>[^ \t\r\n'"\\]+)
+    |'(?P<single>[^']*)'
+    |"(?P<double>(?:[^"\\]|\\.)*)"
+    |\\(?P<escaped>.)
+    |(?P<space>[ \t\r\n]+)
+""", re.VERBOSE | re.DOTALL)
+_ESCAPED_IN_DOUBLE_QUOTES = re.compile(r'\\([\\"])')
+
+
+def split_args(string: str) -> list:
     """
-    Returns the name of module calling this function.
-    depth: int
-        Explores with f_back() till the name of module changes by this depth.
+    Splits string into args same as shlex.split, e.g. 'a "b c"' into ['a', 'b c'].
+    shlex reads a char at a time, so pieces of args are matched by regex instead.
+    If string has neither quotes nor backslash, it's just split by whitespaces.
     """
-    first_frame = inspect.currentframe()
-    last_filename = first_frame.f_code.co_filename
-    count = 0
-    frame = first_frame.f_back
-    while True:
-        while last_filename == frame.f_code.co_filename:
-            frame = frame.f_back
+    if not any(char in string for char in _QUOTES_AND_ESCAPE):
+        return [token for token in _SHELL_WHITESPACES.split(string) if token]
+    args = []
+    pieces = None  # pieces of the arg being read
+    position = 0
+    length = len(string)
+    while position < length:
+        match = _SHELL_PIECE.match(string, position)
+        if match is None:  # unclosed quotes or trailing backslash
+            import shlex
+            return shlex.split(string)  # raises ValueError same as shlex
+        position = match.end()
+        kind = match.lastgroup
+        if kind == "space":
+            if pieces is not None:
+                args.append("".join(pieces))
+                pieces = None
+            continue
+        if pieces is None:
+            pieces = []
+        if kind == "double":
+            pieces.append(_ESCAPED_IN_DOUBLE_QUOTES.sub(r"\1", match.group(kind)))
         else:
-            last_filename = frame.f_code.co_filename
-            count += 1
-            if count >= name_change_count:
-                break
-            else:
-                frame = frame.f_back
-    name = pathlib.Path(frame.f_code.co_filename).stem
-    return name
+            pieces.append(match.group(kind))
+    if pieces is not None:
+        args.append("".join(pieces))
+    return args
 
 
-if hasattr(__main__, "__file__"):
-    filename_of_main = pathlib.Path(__main__.__file__).stem
-else:  # In Jupyter Notebook, __main__ module has no attribute of __file__
-    filename_of_main = "__main__"
+ENV_OF_COMPLETION = "_CLAPPY_COMPLETE"  # set to the name of shell by the hooks of clappy.complete
 
 
-def is_called_from_main():
-    caller_name = get_caller_name(4)
-    if filename_of_main == caller_name:
-        return True
-    else:
-        return False
+class CompletionRequest:
+    """Words of the command line to complete, given by the hook of shell completion in environment variables."""
+    __slots__ = ("shell", "args", "incomplete")
 
+    def __init__(self, shell: str, args: list, incomplete: str):
+        self.shell = shell
+        self.args = args  # words after the command and before the word under the cursor
+        self.incomplete = incomplete
 
-def normalize_bound(func):
+    @classmethod
+    def from_environ(cls, environ=os.environ) -> "CompletionRequest":
+        line = environ.get("COMP_LINE", "")
+        try:
+            line = line[:int(environ.get("COMP_POINT", len(line)))]
+        except ValueError:
+            pass
+        words = None
+        for closing in ("", '"', "'"):  # the word under the cursor may have an unclosed quote
+            try:
+                words = split_args(line + closing)
+                break
+            except ValueError:
+                continue
+        if words is None:
+            words = line.split()
+        incomplete = words.pop() if words and not line[-1].isspace() else ""
+        return cls(environ[ENV_OF_COMPLETION], words[1:], incomplete)
+
+
+class LazyLogger:
+    """
+    Proxy of logging.Logger which imports logging only when a message can be emitted.
+    Until logging is imported by anyone, no handler is configured and messages below WARNING are dropped anyway.
+    So debug() and info() are skipped without importing logging in such case.
     """
-    'As long as given args are same', callable with @functools.lrc_cache returns cache by this func.
-    Without this, it might not return cache. It depends on the way or order of giving args.
 
-    @normalize_bound
-    @lrc_cache()
-    def example(foo, bar):
-        pass
+    def __init__(self, name: str):
+        self.name = name
+        self._logger = None
+
+    def _get_logger(self):
+        if self._logger is None:
+            import logging
+            self._logger = logging.getLogger(self.name)
+        return self._logger
+
+    def debug(self, msg, *args, **kwargs):
+        if "logging" in sys.modules:
+            kwargs.setdefault("stacklevel", 2)
+            self._get_logger().debug(msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        if "logging" in sys.modules:
+            kwargs.setdefault("stacklevel", 2)
+            self._get_logger().info(msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        kwargs.setdefault("stacklevel", 2)
+        self._get_logger().warning(msg, *args, **kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        kwargs.setdefault("stacklevel", 2)
+        self._get_logger().error(msg, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._get_logger(), name)
+
+
+class Stats:
+    """
+    Counts of calls and cumulative seconds of work done by clappy, optionally for each key like dest of action.
+    Nothing is collected unless enabled, and callers check enabled before calling methods to cost nothing.
+    It's enabled on import if $CLAPPY_STATS is set.
     """
-    signature = inspect.signature(func)
 
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        bound = signature.bind(*args, **kwargs)
-        bound.apply_defaults()
-        return func(*bound.args, **bound.kwargs)
-    return wrapper
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._records = {}  # Dict[name, [calls, seconds, Dict[key, [calls, seconds]]]]
+
+    def count(self, name: str, key=None, seconds: float = 0.0):
+        record = self._records.get(name)
+        if record is None:
+            record = self._records[name] = [0, 0.0, {}]
+        record[0] += 1
+        record[1] += seconds
+        if key is not None:
+            record_of_key = record[2].get(key)
+            if record_of_key is None:
+                record_of_key = record[2][key] = [0, 0.0]
+            record_of_key[0] += 1
+            record_of_key[1] += seconds
+
+    def measure(self, name: str, key=None) -> "_Measurement":
+        """Returns context manager counting a call of name with seconds spent in the with block."""
+        return _Measurement(self, name, key)
+
+    def reset(self):
+        self._records = {}
+
+    def as_dict(self) -> dict:
+        result = {}
+        for name, (calls, seconds, records_of_keys) in self._records.items():
+            result[name] = {"calls": calls, "seconds": seconds}
+            if records_of_keys:
+                result[name]["by_key"] = {key: {"calls": calls_of_key, "seconds": seconds_of_key}
+                                          for key, (calls_of_key, seconds_of_key) in records_of_keys.items()}
+        return result
+
+
+class _Measurement:
+    __slots__ = ("stats", "name", "key", "start")
+
+    def __init__(self, stats_: Stats, name: str, key):
+        self.stats = stats_
+        self.name = name
+        self.key = key
+        self.start = 0.0
+
+    def __enter__(self):
+        from time import perf_counter
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        from time import perf_counter
+        self.stats.count(self.name, self.key, perf_counter() - self.start)
+
+
+stats = Stats(enabled=bool(os.environ.get("CLAPPY_STATS")))
@@ -1,8 +1,12 @@
 import unittest
+import os
 import sys
+import subprocess
 import functools
 import importlib
 import pathlib
+import tempfile
+from unittest import mock
 from test.support import captured_stderr, captured_stdout
 from textwrap import dedent
 
@@ -432,11 +436,530 @@ class TestClappy(TestBase):
             actual_output = stderr.getvalue().splitlines()
             self.assertEqual(actual_output, expected_output)
 
+    @temp_argv("--opt0 0 --opt1 1 --unknown u --opt2 2 --flag")
+    def test_incremental_parse(self):
+        parser = cl.get_parser()
+        with mock.patch.object(parser, "_parse_known_args", wraps=parser._parse_known_args) as full_pass:
+            self.assertEqual([cl.parse(f"--opt{i}") for i in range(3)], ["0", "1", "2"])
+            self.assertTrue(cl.parse("--flag", is_flag=True))
+            self.assertEqual(cl.parse("--absent", default="3", type=int), 3)
+            self.assertEqual(parser.parse_known_args()[1], ["--unknown", "u"])
+        self.assertEqual(full_pass.call_count, 1)
+
+    @temp_argv("--items 1 2 3 --other x")
+    def test_written_dests(self):
+        cl.parse("--items", nargs=cl.nargs.ONE_OR_MORE)
+        cl.parse("--other")
+        cl.parse("--absent", default="default")
+        parser = cl.get_parser()
+        namespace, _ = parser._parse_known_args_sparse(parser._args_getting_parsed)
+        self.assertEqual(list(namespace.written), ["items", "other"])
+
+    @temp_argv("--bar 1 sub --foo 2")
+    def test_clear_parser(self):
+        import gc
+        import weakref
+        with cl.get_group("group"):
+            self.assertEqual(cl.parse("--bar"), "1")
+        with cl.get_exclusive_group("exclusive"):
+            cl.parse("--baz", is_flag=True)
+        with cl.subcommand("sub") as sub:
+            self.assertEqual(sub.parse("--foo"), "2")
+        parser = weakref.ref(cl.get_parser())
+        del sub
+        cl.clear_parser()
+        gc.collect()
+        self.assertIsNone(parser())
+        self.assertIsNone(cl.get_session().active_subcommand)
+        group = cl.get_group("group")
+        self.assertIn(group, cl.get_parser()._action_groups)  # not the group of the old parser
+        self.assertEqual(cl.parse("--bar"), "1")
+
+    @temp_argv("--given 1 sub --sub_given 2")
+    def test_sparse_namespace(self):
+        self.assertEqual(cl.parse("--given"), "1")
+        self.assertEqual(cl.parse("--absent", default=3), 3)
+        sub = cl.subcommand("sub")
+        self.assertEqual(sub.parse("--sub_given"), "2")
+        self.assertEqual(sub.parse("--given", default="sub default"), "sub default")  # same as argparse
+        parser = cl.get_parser()
+        namespace, _ = parser._parse_known_args_sparse(parser._args_getting_parsed)
+        self.assertEqual(set(vars(namespace)), {"given", "sub_given"})  # defaults are resolved on read
+        self.assertEqual(namespace.absent, 3)
+        self.assertEqual(namespace, parser.parse_aside(parser._args_getting_parsed))
+
+        import pickle
+        for public_namespace in (parser.parse_known_args()[0], parser.parse_args(parser._args_getting_parsed)):
+            self.assertEqual(vars(public_namespace), {"given": "sub default", "absent": 3, "_invoked_command": "sub",
+                                                      "sub_given": "2"})
+            self.assertEqual(pickle.loads(pickle.dumps(public_namespace)), public_namespace)
+
+    def test_caller_module(self):
+        def resolve():
+            return cl.utils.get_caller_module()
+        caller_module = resolve()
+        self.assertEqual((caller_module.name, caller_module.stem), (__name__, name_of_this_file))
+        self.assertIs(resolve(), caller_module)
+
+        cl.set_name_of_main_script(name_of_this_file)
+        self.assertTrue(caller_module.is_main)
+        self.assertFalse(cl.utils.CallerModule(f"pkg.{name_of_this_file}", name_of_this_file).is_main)
+
+    @temp_argv("--opt0 a --choice b")
+    def test_registration_cache(self):
+        for _ in range(2):
+            self.assertEqual([cl.parse(f"--opt{i}") for i in range(200)][0], "a")
+            self.assertEqual(cl.parse("--choice", choices=["a", "b"], default=["a"]), "b")
+
+    @temp_argv("--foo 1 --bar")
+    def test_parse_lazy(self):
+        with self.subTest("on read"):
+            parser = cl.get_parser()
+            with mock.patch.object(parser, "_parse_known_args", wraps=parser._parse_known_args) as full_pass:
+                foo = cl.parse_lazy("--foo", type=int)
+                bar = cl.parse_lazy("--bar", is_flag=True)
+                self.assertFalse(foo.resolved)
+                self.assertEqual(foo.value, 1)
+                self.assertTrue(bar.resolved)
+                self.assertTrue(bar.value)
+            self.assertEqual(full_pass.call_count, 1)
+
+        with self.subTest("on end of with block"):
+            self.tearDown()
+            cl.set_args_getting_parsed("--foo 1")
+            with cl.get_parser():
+                foo = cl.parse_lazy("--foo")
+            self.assertTrue(foo.resolved)
+            self.assertEqual(foo.value, "1")
+
+    @temp_argv("--foo 1 c150 --opt x")
+    def test_subcommand_dispatch(self):
+        self.assertEqual(cl.parse("--foo"), "1")
+        parser = cl.get_parser()
+        with mock.patch.object(parser, "_parse_known_args", wraps=parser._parse_known_args) as full_pass:
+            invoked = [i for i in range(200) if cl.subcommand(f"cmd{i}", aliases=[f"c{i}"])]
+        self.assertEqual(invoked, [150])
+        self.assertEqual(full_pass.call_count, 1)
+
+    @temp_argv("db migrate --dry-run")
+    def test_nested_subcommand(self):
+        db = cl.subcommand("db")
+        self.assertTrue(db)
+        migrate, seed = db.subcommand("migrate"), db.subcommand("seed")
+        self.assertTrue(migrate)
+        self.assertFalse(seed)
+        self.assertEqual(migrate.parse("--dry-run", is_flag=True), True)
+        self.assertEqual(seed.parse("-n", type=int, default=5), 5)
+
+        other = cl.subcommand("other")
+        self.assertFalse(other)
+        self.assertFalse(other.subcommand("nested"))
+        self.assertEqual(other.parse("--flag", is_flag=True), False)
+        self.assertIsNone(other._parser)
+        self.assertIsNone(seed._parser)
+
+    @temp_argv("db migrate v2 a b --dry-run --steps 3")
+    def test_decorated_subcommand(self):
+        @cl.subcommand
+        def db(*, url="sqlite://"):
+            """Manages the database."""
+            return "db", url
+
+        @cl.subcommand(name="ls")
+        def list_items(path="."):
+            return "ls", path
+
+        db_subcommand = cl.get_parser()._subcommands_by_name["db"]
+        self.assertEqual(db_subcommand.help, "Manages the database.")
+
+        @db_subcommand.subcommand
+        def migrate(version, *files, dry_run=False, steps: int = 1):
+            return version, files, dry_run, steps
+
+        self.assertEqual(cl.dispatch(), ("v2", ("a", "b"), True, 3))
+        self.assertIsNone(cl.get_parser()._subcommands_by_name["ls"]._parser)
+        cl.set_args_getting_parsed(["ls"])
+        self.assertEqual(cl.dispatch(), ("ls", "."))
+
+    @temp_argv("--verbose --quiet")
+    def test_exclusive_group(self):
+        with cl.get_group("output"):
+            with cl.get_exclusive_group("verbosity"):
+                self.assertTrue(cl.parse("--verbose", is_flag=True))
+        self.assertIs(cl.get_exclusive_group("verbosity"), cl.get_exclusive_group("verbosity"))
+        with captured_stderr() as stderr:
+            with self.assertRaises(SystemExit):
+                with cl.get_exclusive_group("verbosity"):
+                    cl.parse("--quiet", is_flag=True)
+        self.assertIn("argument --quiet: not allowed with argument --verbose", stderr.getvalue())
+
+    @temp_argv("--quiet")
+    def test_required_exclusive_group(self):
+        with cl.get_exclusive_group(required=True):
+            self.assertFalse(cl.parse("--verbose", is_flag=True))
+            self.assertTrue(cl.parse("--quiet", is_flag=True))
+        with cl.Session([]):
+            with captured_stderr() as stderr:
+                with self.assertRaises(SystemExit):
+                    with cl.get_exclusive_group(required=True):
+                        cl.parse("--verbose", is_flag=True)
+                        cl.parse("--quiet", is_flag=True)
+        self.assertIn("one of the arguments --verbose --quiet is required", stderr.getvalue())
+
+    @temp_argv("--verb --foo 1")
+    def test_abbreviations_across_groups(self):
+        with cl.get_group("output"):
+            self.assertTrue(cl.parse("--verbose", is_flag=True))
+        with cl.get_group("b"):
+            self.assertEqual(cl.parse("--foobar"), "1")
+        with self.assertLogs("clappy", "WARNING") as logs:
+            with cl.get_group("a"):
+                self.assertEqual(cl.parse("--foo"), "1")
+        expected = cl.get_parser().AMBIGUOUS_PREFIX_MESSAGE.format(
+            shorter="--foo", shorter_group="a", longer="--foobar", longer_group="b")
+        self.assertIn(expected, [record.getMessage() for record in logs.records])
+        self.assertIsNone(cl.parse("--foobar"))
+
+    def test_long_argv(self):
+        args = []
+        for i in range(10000):
+            args += [f"--opt{i % 3}", str(i), f"file{i}"]
+        cl.set_args_getting_parsed(args)
+        self.assertEqual([cl.parse(f"--opt{i}") for i in range(3)], ["0", "1", "2"])
+        self.assertEqual(cl.parse("files", nargs="*"), ["file0"])
+        self.assertEqual(len(cl.get_parser().parse_known_args()[1]), 9999)
+
+    def test_stream(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "paths.txt")
+            with open(path, "w") as file:
+                file.write("a.txt\nb.txt\n")
+            cl.set_args_getting_parsed(["--paths", f"@{path}"])
+            paths = cl.parse("--paths", nargs=cl.nargs.STREAM)
+            self.assertEqual(list(paths), ["a.txt", "b.txt"])
+            self.assertEqual(list(paths), ["a.txt", "b.txt"])
+        self.assertEqual(cl.parse("files", nargs=cl.nargs.STREAM), cl.Stream("-"))
+
+    def test_arg_file_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path, referenced_path = os.path.join(directory, "args.txt"), os.path.join(directory, "more.txt")
+            with open(path, "w") as file:
+                file.write(f"--foo\n1\n@{referenced_path}\n")
+            with open(referenced_path, "w") as file:
+                file.write("--bar\n2\n")
+            cl.set_args_getting_parsed([f"@{path}"])
+            cl.get_parser(fromfile_prefix_chars="@")
+            with mock.patch("builtins.open", wraps=open) as opened:
+                self.assertEqual(cl.parse("--foo"), "1")
+                self.assertEqual(cl.parse("--bar"), "2")
+                self.assertEqual(opened.call_count, 2)
+
+                with open(referenced_path, "a") as file:
+                    file.write("--baz\n3\n")
+                self.assertEqual(cl.parse("--baz"), "3")
+                self.assertEqual(opened.call_count, 5)
+
+                with cl.Session([f"@{path}"]):  # files expanded by another parser are shared
+                    cl.get_parser(fromfile_prefix_chars="@")
+                    self.assertEqual(cl.parse("--baz"), "3")
+                self.assertEqual(opened.call_count, 5)
+            cl.clear_parser()
+            self.assertEqual(cl.modified_argparse.ModifiedParser._expanded_files, {})
+
+    @temp_argv("--foo 1 --bar 2")
+    def test_conversion_cache(self):
+        converted = []
+
+        def to_int(arg):
+            converted.append(arg)
+            return int(arg)
+
+        self.assertEqual(cl.parse("--foo", type=to_int), 1)
+        self.assertEqual(cl.parse("--bar", type=to_int, default="3"), 2)
+        self.assertEqual(cl.parse("--baz", type=to_int, default="3"), 3)
+        self.assertEqual(cl.parse("--qux", type=to_int, default="4", caches_conversion=False), 4)
+        self.assertEqual(cl.parse("positional", nargs="?"), None)  # parses all args again
+        self.assertEqual(converted, ["1", "2", "3", "4", "4"])
+
+    @temp_argv("--foo 1 --bar 2")
+    def test_stats(self):
+        cl.parse("--foo")
+        self.assertEqual(cl.stats(), {})
+
+        cl.enable_stats()
+        cl.parse("--bar", type=int)
+        cl.parse("--bar", type=int)
+        stats = cl.stats(reset=True)
+        cl.enable_stats(False)
+        self.assertEqual(stats["registration_cache_miss"]["calls"], 1)
+        self.assertEqual(stats["registration_cache_hit"]["calls"], 1)
+        self.assertEqual(stats["type_conversion"]["by_key"]["--bar"]["calls"], 1)
+        self.assertEqual(stats["parse"]["by_key"][__name__]["calls"], 2)
+        self.assertGreaterEqual(stats["frame_walk"]["calls"], 2)
+        self.assertEqual(cl.stats(), {})
+
+    @temp_argv("--foo main")
+    def test_session(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        def handle(i):
+            with cl.Session(f"--foo {i} sub --bar {i}"):
+                with cl.get_group("group"):
+                    foo = cl.parse("--foo", type=int)
+                sub = cl.subcommand("sub")
+                return foo, sub.parse("--bar", type=int)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(handle, range(100)))
+        self.assertEqual(results, [(i, i) for i in range(100)])
+        self.assertEqual(cl.parse("--foo"), "main")
+        self.assertEqual(cl.Session("--foo other").run(cl.parse, "--foo"), "other")
+
+    @temp_argv("--foo main")
+    def test_session_entered_by_threads(self):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        session = cl.Session("--foo shared")
+        barrier = threading.Barrier(4)
+        lock = threading.Lock()  # the parser of a session is not for parallel parse
+
+        def handle():
+            with session:
+                barrier.wait(timeout=10)  # all threads are within the session at once
+                with lock:
+                    value = cl.parse("--foo")
+                barrier.wait(timeout=10)
+            return value, cl.get_session()
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = [executor.submit(session.run, handle) for _ in range(4)]
+            self.assertEqual([future.result() for future in results], [("shared", session)] * 4)
+        with session:
+            with cl.Session([]) as inner:
+                self.assertIs(cl.get_session(), inner)
+            self.assertIs(cl.get_session(), session)
+        self.assertEqual(cl.parse("--foo"), "main")
+
+    @temp_argv("--count 1 build")
+    def test_parse_many(self):
+        self.assertEqual(cl.parse("--count", type=int), 1)
+        cl.parse("--name")
+        self.assertEqual(cl.parse("command"), "build")
+        argvs = ["deploy --name 'a b' --count 2", ["stop"]]
+        expected = [("deploy", "a b", 2), ("stop", None, None)]
+        converted_values = cl.get_parser()._converted_values
+        count_of_values = len(converted_values)
+        for processes in (None, 2):
+            with self.subTest(processes=processes):
+                namespaces = list(cl.parse_many(argvs, processes=processes))
+                self.assertEqual([(ns.command, ns.name, ns.count) for ns in namespaces], expected)
+        self.assertEqual(len(converted_values), count_of_values)
+        self.assertEqual(cl.parse("--count", type=int), 1)
+        self.assertEqual(cl.parse("command"), "build")
+
+    @temp_argv("db migrate")
+    def test_parse_many_with_subcommands(self):
+        db = cl.subcommand("db")
+        migrate = db.subcommand("migrate")
+        self.assertTrue(migrate.invoked)
+        self.assertFalse(migrate.parse("--dry-run", is_flag=True))
+        namespaces = list(cl.parse_many(["db migrate --dry-run"]))
+        self.assertEqual(namespaces[0]._invoked_command, "migrate")
+        self.assertTrue(namespaces[0].dry_run)
+        with captured_stderr() as stderr:
+            with self.assertRaises(SystemExit):
+                list(cl.parse_many(["db other"]))
+        self.assertIn("error: Failed to find subcommand ['migrate']", stderr.getvalue())
+        self.assertTrue(migrate.invoked)
+        self.assertFalse(migrate.parse("--dry-run", is_flag=True))
+        self.assertTrue(db.invoked)
+
+    @temp_argv("--verbose")
+    def test_parse_many_with_decorated_subcommand(self):
+        @cl.subcommand
+        def deploy(target, *, retries=3):
+            return target, retries
+
+        self.assertTrue(cl.parse("--verbose", is_flag=True))
+        for processes in (None, 2):
+            with self.subTest(processes=processes):
+                namespaces = list(cl.parse_many(["deploy web --retries 5", "deploy db"], processes=processes))
+                self.assertEqual([vars(namespace) for namespace in namespaces],
+                                 [{"verbose": False, "_invoked_command": "deploy", "target": "web", "retries": 5},
+                                  {"verbose": False, "_invoked_command": "deploy", "target": "db", "retries": 3}])
+                with captured_stderr() as stderr:
+                    with self.assertRaises(SystemExit):
+                        list(cl.parse_many(["deploy web --retry-count 5"], processes=processes))
+                self.assertIn("error: unrecognized args: --retry-count 5", stderr.getvalue())
+        self.assertTrue(cl.parse("--verbose", is_flag=True))
+        self.assertIsNone(cl.dispatch())
+
+    def test_split_args(self):
+        import shlex
+        for string in ["", " a  b\t", "--foo 'a b' \"c \\\" d\" e\\ f", "a'b'\"c\"", "'' \"\""]:
+            self.assertEqual(cl.utils.split_args(string), shlex.split(string))
+        with self.assertRaises(ValueError):
+            cl.utils.split_args("'unclosed")
+
+    @temp_argv("--port 1")
+    def test_layered_defaults(self):
+        with tempfile.TemporaryDirectory() as config_dir:
+            ini_path = os.path.join(config_dir, "app.ini")
+            with open(ini_path, "w") as file:
+                file.write("[app]\nport = 80\nhost = example.com\nlog-level = info\nverbose = yes\ntags = a 'b c'\n")
+            with mock.patch.dict("os.environ", APP_LOG_LEVEL="debug"):
+                cl.get_parser(env_prefix="APP_", config_files=[ini_path, os.path.join(config_dir, "missing.toml")])
+        self.assertEqual(cl.parse("--port", type=int), 1)
+        self.assertEqual(cl.parse("--log-level"), "debug")
+        self.assertEqual(cl.parse("--host", required=True), "example.com")
+        self.assertEqual(cl.parse("--verbose", is_flag=True), True)
+        self.assertEqual(cl.parse("--tags", nargs="*"), ["a", "b c"])
+        self.assertEqual(cl.parse("--other", default="default"), "default")
+
+    @temp_argv("other")
+    def test_defaults_of_subcommand_not_invoked(self):
+        with mock.patch.dict("os.environ", APP_HOST="example.com", APP_VERBOSE="1"):
+            cl.get_parser(env_prefix="APP_")
+        cl.subcommand("other")
+        sub = cl.subcommand("sub")
+        self.assertFalse(sub.invoked)
+        self.assertEqual(sub.parse("--port", type=int, default="80"), 80)
+        self.assertEqual(sub.parse("--host"), "example.com")
+        self.assertEqual(sub.parse("--verbose", is_flag=True), True)
+        self.assertEqual(sub.parse("--quiet", is_flag=True), False)
+        self.assertEqual(sub.parse_lazy("--retries", type=int, default="3").value, 3)
+
+    def test_frozen_parser(self):
+        script = ("import clappy as cl\n"
+                  "with cl.get_parser(prog='tool'):\n"
+                  "    name = cl.parse('--name', default='world')\n"
+                  "    count = cl.parse('-c', '--count', type=int, default=1)\n"
+                  "    src = cl.parse('src')\n"
+                  "    tags = cl.parse('--tag', action='append')\n"
+                  "print(name, count, src, tags, cl.stats().get('frozen_parse', {}).get('calls'))\n")
+        env = dict(os.environ, PYTHONPATH=str(pathlib.Path(cl.__file__).parent.parent), CLAPPY_STATS="1")
+
+        def run(*args):
+            return subprocess.run([sys.executable, *args], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                  universal_newlines=True).stdout
+
+        with tempfile.TemporaryDirectory() as script_dir:
+            path = os.path.join(script_dir, "tool.py")
+            with open(path, "w") as file:
+                file.write(script)
+            run("-m", "clappy.freeze", path, "-h")
+            self.assertTrue(os.path.isfile(os.path.join(script_dir, "tool_clappy_frozen.py")))
+            self.assertEqual(run(path, "x", "-c", "2", "--tag", "a"), "world 2 x ['a'] 4\n")
+            # the value of src taken before --tag is registered changes, and the dynamic parser logs it
+            self.assertEqual(run(path, "--tag", "a", "x"), "world 1 a ['a'] 3\n")
+            stderr = subprocess.run([sys.executable, path, "--tag", "a", "x"], env=env, stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.PIPE, universal_newlines=True).stderr
+            self.assertIn('While parsing tag, the value of "src" changed from a to x.', stderr)
+            self.assertEqual(run(path, "x", "--unknown"), "world 1 x None None\n")
+            self.assertIn("usage: tool", run(path, "-h"))
+
+    def test_completion(self):
+        script = ("import clappy as cl\n"
+                  "print('ran', file=open(__file__ + '.log', 'a'))\n"
+                  "with cl.get_parser(prog='tool'):\n"
+                  "    verbose = cl.parse('-v', '--verbose', is_flag=True)\n"
+                  "    if db := cl.subcommand('db'):\n"
+                  "        level = db.parse('--level', choices=['debug', 'info'])\n"
+                  "        target = db.parse('target', choices=['prod', 'dev'])\n"
+                  "    cl.subcommand('serve')\n"
+                  "print('done')\n")
+        with tempfile.TemporaryDirectory() as script_dir:
+            path = os.path.join(script_dir, "tool.py")
+            with open(path, "w") as file:
+                file.write(script)
+
+            def complete(line, *args):
+                env = dict(os.environ, PYTHONPATH=str(pathlib.Path(cl.__file__).parent.parent),
+                           CLAPPY_CACHE_DIR=script_dir, _CLAPPY_COMPLETE="bash", COMP_LINE=line)
+                return subprocess.run([sys.executable, *args], env=env, stdout=subprocess.PIPE,
+                                      universal_newlines=True).stdout.splitlines()
+
+            def count_runs():
+                with open(path + ".log") as log:
+                    return len(log.readlines())
+
+            self.assertEqual(complete("tool ", path), ["db", "serve"])
+            self.assertEqual(complete("tool --v", path), ["--verbose"])
+            self.assertEqual(complete("tool db --level ", path), ["debug", "info"])
+            self.assertEqual(complete("tool -v db d", path), ["dev"])
+            self.assertEqual(count_runs(), 4)
+            # answered from the specs stored by the runs above
+            self.assertEqual(complete("tool db --level=i", "-m", "clappy.complete", "bash", path), ["info"])
+            self.assertEqual(complete("tool s", "-m", "clappy.complete", "bash", path), ["serve"])
+            self.assertEqual(count_runs(), 4)
+            self.assertEqual(complete("tool serve -", "-m", "clappy.complete", "bash", path), ["-h", "--help"])
+            self.assertEqual(count_runs(), 5)
+
+            # candidates are printed at exit of scripts without the with block, instead of their outputs
+            plain_path = os.path.join(script_dir, "plain.py")
+            with open(plain_path, "w") as file:
+                file.write(script.replace("with cl.get_parser(prog='tool'):\n", "").replace("\n    ", "\n"))
+            self.assertEqual(complete("plain ", plain_path), ["db", "serve"])
+            self.assertEqual(complete("plain db --level ", plain_path), ["debug", "info"])
+            self.assertEqual(complete("plain d", "-m", "clappy.complete", "bash", plain_path), ["db"])
+
+        from clappy import complete
+        self.assertIn("complete -o default -F _clappy_complete_tool tool\n", complete.make_hook("bash", path, "tool"))
+        self.assertIn("compdef _clappy_complete_tool tool\n", complete.make_hook("zsh", path, "tool"))
+
+    def test_help_cache(self):
+        def print_help(help_of_foo):
+            cl.set_args_getting_parsed("-h")
+            with captured_stdout() as stdout:
+                with self.assertRaises(SystemExit):
+                    with cl.get_parser(prog="prog.py", caches_help=True):
+                        cl.parse("--foo", help=help_of_foo)
+            self.tearDown()
+            return stdout.getvalue()
+
+        with tempfile.TemporaryDirectory() as cache_dir, mock.patch.dict("os.environ", CLAPPY_CACHE_DIR=cache_dir):
+            rendered = print_help("help of foo")
+            with mock.patch("argparse.ArgumentParser.format_help") as format_help:
+                self.assertEqual(print_help("help of foo"), rendered)
+            format_help.assert_not_called()
+            self.assertIn("changed help", print_help("changed help"))
+
     @temp_argv("--foo val")
     def test_meaningless_dest(self):
         val = cl.parse("-f", "--foo", dest="aiueo")
         self.assertEqual(val, "val")
 
 
+class TestBench(unittest.TestCase):
+    def test_run(self):
+        from clappy import bench
+        report = bench.run(["argv", "subcommands"], repeat=1, quick=True)
+        self.assertEqual([(result["name"], result["size"]) for result in report["results"]],
+                         [("argv", 10), ("argv", 1000), ("subcommands", 1), ("subcommands", 50)])
+        for result in report["results"]:
+            self.assertTrue(result["clappy"] > 0 and result["argparse"] > 0)
+
+
+class TestImportTime(unittest.TestCase):
+    """Locks in modules imported by clappy. Only clappy itself is allowed in addition to plain argparse."""
+    ALLOWED_MODULES = {"clappy", "clappy.main", "clappy.modified_argparse", "clappy.utils"}
+
+    @staticmethod
+    def get_imported_modules(code):
+        env = dict(os.environ, PYTHONPATH=str(pathlib.Path(cl.__file__).parent.parent))
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                                env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        return {line.split("|")[-1].strip() for line in result.stderr.splitlines()
+                if line.startswith("import time:") and not line.endswith("imported package")}
+
+    def test_modules_imported_to_parse(self):
+        plain_argparse = self.get_imported_modules(
+            "import argparse; parser = argparse.ArgumentParser(); parser.add_argument('--foo');"
+            "parser.parse_known_args(['--foo', '1'])")
+        clappy = self.get_imported_modules(
+            "import clappy; clappy.set_args_getting_parsed('--foo 1'); clappy.parse('--foo')")
+        self.assertEqual(clappy - plain_argparse, self.ALLOWED_MODULES)
+
+
 if __name__ == '__main__':
     unittest.main()